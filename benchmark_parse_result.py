@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+
+import argparse
+import cProfile
+import pstats
+import random
+import tempfile
+import time
+import tracemalloc
+
+import parse_result
+
+from util.base_util import *
+from util.file_util import *
+
+BENCHMARK_BASELINE = path.join(get_home_dir(), '.cache', 'gpu_test_tools', 'benchmark_baseline.json')
+BENCHMARK_CASES = ['json', 'unittest', 'gtest', 'report']
+
+# The inputs are generated with a fixed seed, so the same size gives the same files.
+RANDOM_SEED = 1
+JSON_FANOUT = 16
+
+JSON_ACTUAL   = ['PASS'] * 16 + ['FAIL', 'SKIP', 'CRASH', 'TIMEOUT', 'FAIL PASS', 'FAIL FAIL']
+JSON_EXPECTED = ['PASS'] * 8 + ['FAIL', 'SKIP', 'PASS FAIL', 'CRASH']
+
+def parse_arguments():
+  parser = argparse.ArgumentParser(
+      description='Benchmark parse_result with synthetic results.\n'\
+                  'It reports the throughput and the peak memory of each case and compares them with the baseline.\n\n',
+      formatter_class=argparse.RawTextHelpFormatter)
+  parser.add_argument('--case', '-c', nargs='+', choices=BENCHMARK_CASES, default=BENCHMARK_CASES,
+      help='The cases to run, you can specify multiple. Default is all.\n'\
+           'json     : parse_json_result_file with a nested full results JSON like WebGL/WebGPU.\n'\
+           'unittest : parse_unittest_result_file with a test launcher log like gl_tests/ANGLE.\n'\
+           'gtest    : parse_gtest_result_file with a gtest log like Dawn.\n'\
+           'report   : generate_test_report with the results of above.\n\n')
+  parser.add_argument('--size', '-s', default=100000, type=int,
+      help='The number of tests in each generated result. Default is 100000.\n\n')
+  parser.add_argument('--repeat', '-r', default=3, type=int,
+      help='Run each case this many times and take the fastest. Default is 3.\n\n')
+  parser.add_argument('--dir', '-d',
+      help='Where to generate the results. They are kept and reused if they have the same size.\n'\
+           'By default, they are generated in a temporary directory and removed afterwards.\n\n')
+  parser.add_argument('--profile', '-p', default=0, type=int, metavar='N',
+      help='Profile each case and print the N functions that take the most time.\n\n')
+  parser.add_argument('--baseline', default=BENCHMARK_BASELINE,
+      help='The baseline file, the baselines are stored by host name and size.\n'\
+           'Default is "%s".\n\n' % BENCHMARK_BASELINE)
+  parser.add_argument('--save-baseline', action='store_true',
+      help='Save the results of this run as the baseline.\n\n')
+  parser.add_argument('--tolerance', default=20, type=int,
+      help='The percentage that time or memory can exceed the baseline before it\'s a regression.\n'\
+           'Default is 20.\n\n')
+  args = parser.parse_args()
+
+  if args.size < 1:
+    raise Exception('Invalid size: %d' % args.size)
+  if args.repeat < 1:
+    raise Exception('Invalid repeat number: %d' % args.repeat)
+  if 'report' in args.case:
+    args.case = [x for x in BENCHMARK_CASES if x != 'report' and x in args.case] + ['report']
+  return args
+
+
+def generate_json_result(file_path, size):
+  # Write the nested "tests" directly, so that millions of tests don't need a dict in memory.
+  rand = random.Random(RANDOM_SEED)
+
+  def write_tree(f, depth, first, count):
+    if depth == 0:
+      actual = rand.choice(JSON_ACTUAL)
+      value = {'actual': actual, 'expected': rand.choice(JSON_EXPECTED),
+               'artifacts': {'log': ['log.txt']}}
+      if ' ' in actual:
+        value['times'] = [round(rand.random(), 3) for _ in actual.split()]
+      else:
+        value['time'] = round(rand.random(), 3)
+      f.write(json.dumps(value))
+      return
+    # Split the tests evenly into the children, the leaves are html files.
+    child_size = JSON_FANOUT ** (depth - 1)
+    f.write('{')
+    for i, child_first in enumerate(range(first, first + count, child_size)):
+      name = 'test_%d.html' % child_first if depth == 1 else 'dir%d' % i
+      f.write('%s"%s": ' % (', ' if i else '', name))
+      write_tree(f, depth - 1, child_first, min(child_size, first + count - child_first))
+    f.write('}')
+
+  depth = 1
+  while JSON_FANOUT ** depth < size:
+    depth += 1
+  with open(file_path, 'w') as f:
+    f.write('{"version": 3, "interrupted": false, "path_delimiter": "/", "tests": ')
+    write_tree(f, depth, 0, size)
+    f.write(', "num_failures_by_type": {"PASS": %d}}' % size)
+
+
+def generate_unittest_result(file_path, size):
+  rand = random.Random(RANDOM_SEED)
+  names = ['Suite%d.Test%d/Vulkan' % (i // 100, i) for i in range(size)]
+  with open(file_path, 'w') as f:
+    for i, name in enumerate(names):
+      f.write('[%d/%d] %s (%d ms)\n' % (i+1, size, name, rand.randint(1, 500)))
+      f.write('[%d:%d:1017/120000.000000:INFO:gpu_init.cc(440)] Test output\n' % (i, i))
+    # The failures are listed after the tests.
+    failures = rand.sample(names, size // 20)
+    for i, result_type in enumerate(parse_result.UNITTEST_RESULT_TYPE.keys()):
+      result_failures = failures[i::len(parse_result.UNITTEST_RESULT_TYPE)]
+      f.write('%d tests %s:\n' % (len(result_failures), result_type))
+      for name in result_failures:
+        f.write('%s (../../gpu/command_buffer/tests/test.cc:%d)\n' % (name, rand.randint(1, 999)))
+    f.write('Tests took %d seconds.\n' % (size // 100))
+
+
+def generate_gtest_result(file_path, size):
+  rand = random.Random(RANDOM_SEED)
+  with open(file_path, 'w') as f:
+    f.write('[==========] Running %d tests from %d test suites.\n' % (size, size // 100 + 1))
+    for i in range(size):
+      name = 'BufferTests.MapRead%d/Vulkan_Intel_R_UHD_Graphics_630' % i
+      f.write('[ RUN      ] %s\n' % name)
+      f.write('Warning: backend validation output of %s\n' % name)
+      r = rand.random()
+      if r < 0.9:
+        f.write('[       OK ] %s (%d ms)\n' % (name, rand.randint(1, 500)))
+      elif r < 0.95:
+        f.write('[  SKIPPED ] %s (0 ms)\n' % name)
+      else:
+        f.write('[  FAILED  ] %s, where GetParam() = Vulkan (%d ms)\n' % (name, rand.randint(1, 500)))
+    f.write('[==========] %d tests from %d test suites ran. (%d ms total)\n' %
+            (size, size // 100 + 1, size * 10))
+    f.write('[  FAILED  ] BufferTests.MapRead0/Vulkan_Intel_R_UHD_Graphics_630, where GetParam() = Vulkan (1 ms)\n')
+
+
+BENCHMARK_GENERATORS = {
+  'json':     ('webgpu_blink_web_tests.json', generate_json_result),
+  'unittest': ('gl_tests.log', generate_unittest_result),
+  'gtest':    ('dawn_end2end_tests.log', generate_gtest_result),
+}
+
+BENCHMARK_FUNCTIONS = {
+  'json':     parse_result.parse_json_result_file,
+  'unittest': parse_result.parse_unittest_result_file,
+  'gtest':    parse_result.parse_gtest_result_file,
+  'report':   parse_result.generate_test_report,
+}
+
+def prepare_input(args, case):
+  file_name, generator = BENCHMARK_GENERATORS[case]
+  file_path = path.join(args.dir, file_name)
+  size_file = file_path + '.size'
+  if path.exists(file_path) and path.exists(size_file) and read_file(size_file) == str(args.size):
+    return file_path
+  start_time = time.perf_counter()
+  generator(file_path, args.size)
+  write_file(size_file, str(args.size))
+  print('Generated %s (%s) in %.1fs' % (
+      file_name, parse_result.format_bytes(path.getsize(file_path)), time.perf_counter() - start_time))
+  return file_path
+
+
+def measure(func, func_args, repeat, profile):
+  result = {'seconds': None}
+  for _ in range(repeat):
+    start_time = time.perf_counter()
+    ret = func(*func_args)
+    seconds = time.perf_counter() - start_time
+    result['seconds'] = min(result['seconds'] or seconds, seconds)
+
+  # Measure memory separately, tracing the allocations slows down the run.
+  tracemalloc.start()
+  func(*func_args)
+  result['peak_memory'] = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+
+  if profile:
+    profiler = cProfile.Profile()
+    profiler.runcall(func, *func_args)
+    result['profile'] = pstats.Stats(profiler)
+  return ret, result
+
+
+def compare_baseline(value, baseline_value, tolerance):
+  if not baseline_value:
+    return '', False
+  change = (value - baseline_value) * 100 / baseline_value
+  return '%s%d%%' % ('+' if change >= 0 else '', change), change > tolerance
+
+
+def main():
+  args = parse_arguments()
+  temp_dir = None
+  if args.dir:
+    args.dir = path.abspath(args.dir)
+    mkdir(args.dir)
+  else:
+    temp_dir = args.dir = tempfile.mkdtemp(prefix='benchmark_parse_result_')
+
+  try:
+    results, test_suites = {}, []
+    for case in args.case:
+      if case == 'report':
+        if not test_suites:
+          raise Exception('The report case needs at least one of the parse cases')
+        _, result = measure(parse_result.generate_test_report, [test_suites], args.repeat,
+                            args.profile)
+        result['tests'] = sum(len(x.names) for x in test_suites)
+        result['bytes'] = None
+      else:
+        input_file = prepare_input(args, case)
+        test_suite, result = measure(BENCHMARK_FUNCTIONS[case], [input_file], args.repeat,
+                                     args.profile)
+        test_suites.append(test_suite)
+        result['tests'] = len(test_suite.names)
+        result['bytes'] = path.getsize(input_file)
+      results[case] = result
+  finally:
+    if temp_dir:
+      remove(temp_dir)
+
+  try:
+    baselines = read_json(args.baseline)
+  except (OSError, ValueError):
+    baselines = {}
+  baseline = baselines.get(get_hostname(), {}).get(str(args.size), {})
+
+  regressions = []
+  print('\n%-10s%-10s%-10s%-10s%-12s%-10s%-12s%-12s%s' %
+        ('Case', 'Tests', 'Input', 'Time', 'Tests/s', 'MB/s', 'Peak Mem', 'vs Time', 'vs Mem'))
+  for case, result in results.items():
+    time_change, time_regressed = compare_baseline(
+        result['seconds'], baseline.get(case, {}).get('seconds'), args.tolerance)
+    memory_change, memory_regressed = compare_baseline(
+        result['peak_memory'], baseline.get(case, {}).get('peak_memory'), args.tolerance)
+    if time_regressed or memory_regressed:
+      regressions.append(case)
+    print('%-10s%-10d%-10s%-10s%-12d%-10s%-12s%-12s%s' % (
+        case, result['tests'], parse_result.format_bytes(result['bytes']) if result['bytes'] else '-',
+        '%.3fs' % result['seconds'], result['tests'] / result['seconds'],
+        '%.1f' % (result['bytes'] / result['seconds'] / 2**20) if result['bytes'] else '-',
+        parse_result.format_bytes(result['peak_memory']), time_change or '-', memory_change or '-'))
+
+  if args.profile:
+    for case, result in results.items():
+      print('\n---------- %s: %s ----------' % (case, BENCHMARK_FUNCTIONS[case].__name__))
+      result['profile'].sort_stats('tottime').print_stats(args.profile)
+
+  if args.save_baseline:
+    host_baselines = baselines.setdefault(get_hostname(), {})
+    host_baselines[str(args.size)] = {
+        case: {'seconds': round(x['seconds'], 4), 'peak_memory': x['peak_memory']}
+        for case, x in results.items()}
+    mkdir(path.dirname(path.abspath(args.baseline)))
+    write_file(args.baseline, json.dumps(baselines, indent=2, sort_keys=True))
+    print('\nSaved the baseline to ' + args.baseline)
+  elif regressions:
+    print('\nRegressed more than %d%% from the baseline: %s' % (args.tolerance, ', '.join(regressions)))
+    return 1
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -1,7 +1,11 @@
 #!/usr/bin/env python3
 
 import argparse
+import ast
+import hashlib
+import shutil
 
+from concurrent.futures import ThreadPoolExecutor
 from util.base_util import *
 from util.file_util import *
 
@@ -40,10 +44,44 @@ CHROME_DEPS_TARGET = [
   '//:blink_web_tests',
 ]
 
+# gn gen is skipped if the gn arguments and these files and environment variables are unchanged.
+# The files under the source directory pin the toolchain revisions.
+GN_GEN_STAMP = 'gn_gen.stamp'
+GN_TOOLCHAIN_FILES = [
+  path.join('build', 'config', 'gclient_args.gni'),
+  path.join('build', 'vs_toolchain.py'),
+  path.join('tools', 'clang', 'scripts', 'update.py'),
+]
+GN_TOOLCHAIN_ENV = [
+  'DEPOT_TOOLS_WIN_TOOLCHAIN',
+  'GYP_MSVS_OVERRIDE_PATH',
+  'GYP_MSVS_VERSION',
+  'WINDOWSSDKDIR',
+  'vs2019_install',
+  'vs2022_install',
+]
+
+# The whole build is skipped if the stamp of the last successful build matches.
+BUILD_STAMP = 'build.stamp'
+NINJA_NO_WORK = 'ninja: no work to do.'
+# The number of threads to hash the state of the sub-repos.
+STAMP_THREADS = 8
+
+# Phony targets are resolved to their inputs up to this depth to find the files built last.
+NINJA_QUERY_DEPTH = 3
+
+# The number of threads to copy the packaged files.
+PACK_THREADS = 8
+# The files that are already compressed, they are stored in the zip with --zip-store.
+ZIP_STORE_EXT = [
+  '.7z', '.br', '.bz2', '.crx', '.gif', '.gz', '.jar', '.jpeg', '.jpg', '.mp3', '.mp4',
+  '.ogg', '.png', '.webm', '.webp', '.woff', '.woff2', '.xz', '.zip', '.zst',
+]
+
 PATTERN_COMMIT = r'^commit (\w+)$'
 PATTERN_DAWN_REVISION = r'  \'dawn_revision\': \'\w+\''
 
-def parse_arguments():
+def parse_arguments(argv=None):
   parser = argparse.ArgumentParser(
       description='Build project.',
       formatter_class=argparse.RawTextHelpFormatter)
@@ -62,11 +100,28 @@ def parse_arguments():
            '                        For others, it\'s the same as release build.\n\n')
   parser.add_argument('--update', '-u', action='store_true',
       help='Fetch from origin and rebase to master, then synchronize the dependencies before building.\n\n')
+  parser.add_argument('--force-gen', action='store_true',
+      help='Run "gn gen" even if the build arguments and the toolchain are unchanged.\n'\
+           'It implies --force-build.\n\n')
+  parser.add_argument('--force-build', action='store_true',
+      help='Run ninja even if the source revision and the build arguments are the same as the last successful build.\n\n')
+  parser.add_argument('--parallel', action='store_true',
+      help='Build multiple targets concurrently, their progress is prefixed with the target name.\n\n')
+  parser.add_argument('--jobs', '-j', type=int,
+      help='The number of jobs to run in parallel, it\'s passed to the ninja of each target. Default is decided by autoninja.\n'\
+           'With --parallel, ninja of each target doesn\'t start new jobs while the load average is above the number of CPUs,\n'\
+           'so the CPUs freed by a target that finishes early are used by the others.\n'\
+           'Note that -j overrides the job count that autoninja sets for remote execution.\n\n')
   parser.add_argument('--prefix', '-p',
       help='Install the binaries to a directory after building.\n\n')
   parser.add_argument('--zip', '-z',
       help='Package the binaries to a zip file after building.\n\n')
-  args = parser.parse_args()
+  parser.add_argument('--zip-store', action='store_true',
+      help='Store the files that are already compressed (images, media, archives) in the zip without deflating them.\n\n')
+  parser.add_argument('--hardlink', action='store_true',
+      help='Hardlink the packaged files of Chrome to the build instead of copying them if possible.\n'\
+           'Then the package is changed by rebuilding in place.\n\n')
+  args = parser.parse_args(argv)
 
   if match_any(args.target, lambda x: not x.split('_')[0] in ['Debug', 'Release', 'Default']):
     raise Exception('Target name must start with Debug/Release/Default')
@@ -77,6 +132,10 @@ def parse_arguments():
     if not args.project in ['chrome', 'mesa']:
       raise Exception('Do not support to package ' + args.project)
 
+  args.force_build = args.force_build or args.force_gen
+  args.parallel = args.parallel and len(args.target) > 1
+  if args.jobs is not None and args.jobs < 1:
+    raise Exception('Invalid number of jobs: %d' % args.jobs)
   args.src_dir = path.abspath(args.src_dir)
   if args.prefix:
     args.prefix = path.abspath(args.prefix)
@@ -91,22 +150,208 @@ def parse_arguments():
     if path.exists(args.zip):
       raise Exception('Zip file already exits')
 
+  # Chrome is zipped from the build directly, Mesa needs to be installed first.
   if args.prefix:
     args.pack_dir = args.prefix
-  elif args.zip:
+  elif args.zip and args.project == 'mesa':
     args.pack_dir = path.join(args.src_dir, random_string(8))
   else:
     args.pack_dir = None
   return args
 
 
-def build_gn_project(src_dir, target_dir, build_args, build_targets):
+def parse_ninja_query(output):
+  # Return the explicit inputs of each phony target, None for the real outputs.
+  phony_inputs, name, section = {}, None, None
+  for line in output.splitlines():
+    if not line.startswith(' ') and line.endswith(':'):
+      name, section = line[:-1], None
+      phony_inputs[name] = None
+    elif line.startswith('  input:'):
+      section = 'input'
+      if line.split(':', 1)[1].strip() == 'phony':
+        phony_inputs[name] = []
+    elif line.startswith('  outputs:'):
+      section = 'outputs'
+    elif section == 'input' and phony_inputs.get(name) is not None:
+      dep = line.strip()
+      if not dep.startswith('|'):
+        phony_inputs[name].append(dep)
+  return phony_inputs
+
+
+def resolve_ninja_outputs(src_dir, target_dir, targets, env=None):
+  # Targets like "angle_tests" are phony, a target is built once its inputs are built.
+  outputs, pending = defaultdict(set), {x: [x] for x in targets}
+  for _ in range(NINJA_QUERY_DEPTH):
+    names = sorted(set(name for names in pending.values() for name in names))
+    if not names:
+      break
+    query = execute_return(['ninja', '-C', target_dir, '-t', 'query'] + names, dir=src_dir, env=env)
+    phony_inputs = parse_ninja_query(query)
+    next_pending = defaultdict(list)
+    for target, names in pending.items():
+      for name in names:
+        if phony_inputs.get(name) is None:
+          outputs[target].add(path.normpath(name))
+        else:
+          next_pending[target] += phony_inputs[name]
+    pending = next_pending
+  for target, names in pending.items():
+    outputs[target] |= set(path.normpath(x) for x in names)
+  return outputs
+
+
+def read_ninja_log(log_file, offset):
+  # Return the end time in milliseconds of each output that is built after offset.
+  end_times = {}
+  with open(log_file, 'r') as f:
+    f.seek(offset)
+    for line in f:
+      fields = line.rstrip('\n').split('\t')
+      if len(fields) == 5 and fields[1].isdigit():
+        end_times[path.normpath(fields[3])] = int(fields[1])
+  return end_times
+
+
+def get_gn_gen_hash(src_dir, target_dir, gn_args, env):
+  # ninja runs gn again by itself when any BUILD.gn file changes, so only the
+  # inputs that it doesn't know are hashed.
+  hash_md5 = hashlib.md5()
+  hash_md5.update(gn_args.encode())
+  for file_path in [path.join(target_dir, 'args.gn')] + GN_TOOLCHAIN_FILES:
+    file_path = path.join(src_dir, file_path)
+    hash_md5.update(file_path.encode())
+    if path.exists(file_path):
+      with open(file_path, 'rb') as f:
+        hash_md5.update(f.read())
+  for name in GN_TOOLCHAIN_ENV:
+    hash_md5.update(('%s=%s' % (name, env.get(name, ''))).encode())
+  gn_path = shutil.which('gn', path=env.get('PATH'))
+  if gn_path:
+    gn_stat = os.stat(gn_path)
+    hash_md5.update(('%s:%d:%d' % (gn_path, gn_stat.st_size, gn_stat.st_mtime_ns)).encode())
+  return hash_md5.hexdigest()
+
+
+def find_sub_repos(src_dir):
+  # Return the checked out submodules and gclient dependencies under the source
+  # directory. The gclient ones are listed in .gclient_entries of the gclient root,
+  # which is the source directory itself for standalone ANGLE, Dawn and Aquarium.
+  sub_repos = set()
+  ret = execute_return(['git', 'submodule', 'status', '--recursive'], dir=src_dir)
+  for line in ret.splitlines():
+    fields = line[1:].split()
+    if not line.startswith('-') and len(fields) >= 2:
+      sub_repos.add(path.normpath(fields[1]))
+
+  gclient_root = find_match([src_dir, path.dirname(src_dir)],
+                            lambda x: path.exists(path.join(x, '.gclient_entries')))
+  if gclient_root:
+    entries_file = path.join(gclient_root, '.gclient_entries')
+    entries = ast.literal_eval(read_file(entries_file).split('=', 1)[1].strip())
+    for name in entries:
+      repo_dir = path.normpath(path.join(gclient_root, name))
+      if repo_dir.startswith(src_dir + os.sep) and path.exists(path.join(repo_dir, '.git')):
+        sub_repos.add(path.relpath(repo_dir, src_dir))
+  return sorted(sub_repos)
+
+
+def get_repo_state(repo_dir):
+  # The revision, the local changes and the untracked files are hashed, so that
+  # editing a file again invalidates the stamp. The sub-repos are hashed on their own.
+  hash_md5 = hashlib.md5()
+  hash_md5.update(execute_return(['git', 'rev-parse', 'HEAD'], dir=repo_dir).encode())
+  hash_md5.update(execute_return(['git', 'diff', 'HEAD', '--binary', '--ignore-submodules'],
+                                 dir=repo_dir).encode())
+  untracked = execute_return(['git', 'ls-files', '--others', '--exclude-standard'], dir=repo_dir)
+  for file_name in untracked.splitlines():
+    file_path = path.join(repo_dir, file_name)
+    hash_md5.update(file_name.encode())
+    if path.isfile(file_path):
+      with open(file_path, 'rb') as f:
+        hash_md5.update(f.read())
+  return hash_md5.hexdigest()
+
+
+def get_build_stamp(src_dir, build_targets, gn_hash):
+  repos = ['.'] + find_sub_repos(src_dir)
+  with ThreadPoolExecutor(STAMP_THREADS) as executor:
+    states = list(executor.map(lambda x: get_repo_state(path.join(src_dir, x)), repos))
+  return {
+    'head': execute_return(['git', 'rev-parse', 'HEAD'], dir=src_dir),
+    'repos': {repo: states[i] for i, repo in enumerate(repos)},
+    'gn_args': gn_hash,
+    'targets': sorted(build_targets),
+  }
+
+
+def read_build_stamp(stamp_file):
+  try:
+    return read_json(stamp_file) if path.exists(stamp_file) else None
+  except (OSError, ValueError):
+    return None
+
+
+def build_gn_project(src_dir, target_dir, build_args, build_targets, force_gen=False,
+                     force_build=False, ninja_args=[], name=None):
   env = get_env()
   env.pop('PKG_CONFIG_PATH', None)
   gn_args = ' '.join(['%s=%s' % (key, value) for key, value in build_args.items()])
-  execute(['gn', 'gen', target_dir, '--args=' + gn_args], dir=src_dir, env=env)
-  for target in build_targets:
-    execute_progress(['autoninja', '-C', target_dir, target], dir=src_dir, env=env)
+  build_stamp_file = path.join(src_dir, target_dir, BUILD_STAMP)
+  if not force_build and not force_gen:
+    with trace_span('check build stamp ' + target_dir, 'build'):
+      build_stamp = read_build_stamp(build_stamp_file)
+      up_to_date = build_stamp and build_stamp == get_build_stamp(
+          src_dir, build_targets, get_gn_gen_hash(src_dir, target_dir, gn_args, env))
+    if up_to_date:
+      print('\nSkipped build, %s is up to date with %s' % (target_dir, build_stamp['head']))
+      return
+  remove(build_stamp_file)
+
+  stamp_file = path.join(src_dir, target_dir, GN_GEN_STAMP)
+  build_file = path.join(src_dir, target_dir, 'build.ninja')
+  if (not force_gen and path.exists(stamp_file) and path.exists(build_file) and
+      read_file(stamp_file) == get_gn_gen_hash(src_dir, target_dir, gn_args, env)):
+    print('\nSkipped gn gen, the build arguments and the toolchain of %s are unchanged' % target_dir)
+  else:
+    remove(stamp_file)
+    with trace_span('gn gen ' + target_dir, 'build', args=gn_args):
+      execute(['gn', 'gen', target_dir, '--args=' + gn_args], dir=src_dir, env=env)
+    # args.gn is written by gn gen, so the hash is computed afterwards.
+    write_file(stamp_file, get_gn_gen_hash(src_dir, target_dir, gn_args, env))
+
+  # Build all targets in one ninja run, so that the compiling and linking of
+  # different targets overlap. The time of each target is read from the ninja log.
+  target_outputs = resolve_ninja_outputs(src_dir, target_dir, build_targets, env)
+  log_file = path.join(src_dir, target_dir, '.ninja_log')
+  log_stat = os.stat(log_file) if path.exists(log_file) else None
+  with trace_span('autoninja ' + target_dir, 'build', targets=' '.join(build_targets)):
+    execute_progress(['autoninja', '-C', target_dir] + ninja_args + build_targets, dir=src_dir,
+                     env=env, name=name)
+  # The log is replaced if ninja recompacts it, then the old and new entries are mixed.
+  if path.exists(log_file) and (not log_stat or os.stat(log_file).st_ino == log_stat.st_ino):
+    end_times = read_ninja_log(log_file, log_stat.st_size if log_stat else 0)
+
+    # The time is when the target is finished since the build started.
+    print('\nTarget time of %s:' % target_dir)
+    name_format = '{:<%d}' % (max(len(x) for x in build_targets) + 4)
+    for target in build_targets:
+      times = [end_times[x] for x in target_outputs[target] if x in end_times]
+      if times:
+        seconds = max(times) // 1000
+        print('%s%d min %02d s' % (name_format.format(target), seconds // 60, seconds % 60))
+      else:
+        print('%sup to date' % name_format.format(target))
+
+  # Only stamp the build if ninja has nothing left to do, some actions always rerun.
+  with trace_span('ninja -n ' + target_dir, 'build'):
+    ret = execute_return(['ninja', '-C', target_dir, '-n'] + build_targets, dir=src_dir, env=env)
+  if NINJA_NO_WORK in ret.splitlines():
+    build_stamp = get_build_stamp(src_dir, build_targets, read_file(stamp_file))
+    write_file(build_stamp_file, json.dumps(build_stamp, indent=2))
+  else:
+    print('\nThe build of %s is not stamped, ninja still has work to do' % target_dir)
 
 
 def build_chrome(args):
@@ -128,7 +373,8 @@ def build_chrome(args):
       build_args['is_component_build'] = 'true'
     elif args.build_type == 'default':
       build_args['is_component_build'] = 'false'
-  build_gn_project(args.src_dir, args.target_dir, build_args, CHROME_BUILD_TARGET)
+  build_gn_project(args.src_dir, args.target_dir, build_args, CHROME_BUILD_TARGET,
+                   args.force_gen, args.force_build, args.ninja_args, args.name)
 
 
 def build_angle(args):
@@ -138,7 +384,8 @@ def build_angle(args):
   elif args.build_type in ['release', 'default']:
     build_args['is_debug'] = 'false'
     build_args['dcheck_always_on'] = 'true'
-  build_gn_project(args.src_dir, args.target_dir, build_args, ANGLE_BUILD_TARGET)
+  build_gn_project(args.src_dir, args.target_dir, build_args, ANGLE_BUILD_TARGET,
+                   args.force_gen, args.force_build, args.ninja_args, args.name)
 
 
 def build_dawn(args):
@@ -148,7 +395,8 @@ def build_dawn(args):
   elif args.build_type in ['release', 'default']:
     build_args['is_debug'] = 'false'
     build_args['dcheck_always_on'] = 'true'
-  build_gn_project(args.src_dir, args.target_dir, build_args, DAWN_BUILD_TARGET)
+  build_gn_project(args.src_dir, args.target_dir, build_args, DAWN_BUILD_TARGET,
+                   args.force_gen, args.force_build, args.ninja_args, args.name)
 
 
 def build_aquarium(args):
@@ -159,7 +407,8 @@ def build_aquarium(args):
     build_args['is_debug'] = 'false'
   if is_linux():
     build_args['dawn_enable_opengl'] = 'false'
-  build_gn_project(args.src_dir, args.target_dir, build_args, AQUARIUM_BUILD_TARGET)
+  build_gn_project(args.src_dir, args.target_dir, build_args, AQUARIUM_BUILD_TARGET,
+                   args.force_gen, args.force_build, args.ninja_args, args.name)
 
 
 def build_mesa(args):
@@ -181,27 +430,62 @@ def build_mesa(args):
     build_args['buildtype'] = 'release'
 
   meson_args = ['-D%s=%s' % (key, value) for key, value in build_args.items()]
-  execute(['meson', args.target_dir] + meson_args, dir=args.src_dir)
-  execute_progress(['ninja', '-C', args.target_dir], dir=args.src_dir)
-
-
-def pack_chrome(src_dir, target_dir, dest_dir):
+  with trace_span('meson ' + args.target_dir, 'build'):
+    execute(['meson', args.target_dir] + meson_args, dir=args.src_dir)
+  with trace_span('ninja ' + args.target_dir, 'build'):
+    execute_progress(['ninja', '-C', args.target_dir] + args.ninja_args, dir=args.src_dir,
+                     name=args.name)
+
+
+def resolve_runtime_deps(src_dir, target_dir, targets):
+  # Return the files to package, from their paths relative to the source directory
+  # to the source files. gn desc only takes one label, so the queries run in parallel
+  # and the deps shared by the targets are merged before checking the file system.
+  def query(target):
+    return execute_return(['gn', 'desc', target_dir, target, 'runtime_deps'], dir=src_dir)
+
+  with ThreadPoolExecutor(len(targets)) as executor:
+    rel_deps = set()
+    for ret in executor.map(query, targets):
+      rel_deps.update([path.normpath(path.join(target_dir, x)) for x in ret.splitlines()])
+
+  # The symbols are not packaged except for the debug build.
+  skip_pdb = is_win() and not 'Debug' in target_dir
+  deps = {}
+  for rel_dep in sorted(rel_deps):
+    src_dep = path.join(src_dir, rel_dep)
+    if rel_dep.startswith('..') or rel_dep in deps:
+      continue
+    if path.isfile(src_dep):
+      if not (skip_pdb and path.dirname(rel_dep) == target_dir and rel_dep.endswith('.pdb')):
+        deps[rel_dep] = src_dep
+    elif path.isdir(src_dep):
+      for root, _, files in os.walk(src_dep):
+        for file_name in files:
+          file_path = path.join(root, file_name)
+          deps[path.relpath(file_path, src_dir)] = file_path
+  return deps
+
+
+def pack_chrome(src_dir, target_dir, dest_dir, hardlink=False):
+  start_time = time.perf_counter()
   print()
   for target in CHROME_DEPS_TARGET:
     print('Packaging ' + target)
-    ret = execute_return(['gn', 'desc', target_dir, target, 'runtime_deps'], dir=src_dir)
-    for dep in ret.splitlines():
-      src_dep = path.abspath(path.join(src_dir, target_dir, dep))
-      dest_dep = path.abspath(path.join(dest_dir, target_dir, dep))
-      if path.exists(src_dep) and not path.exists(dest_dep):
-        dest_dep_dir = path.dirname(dest_dep)
-        mkdir(dest_dep_dir)
-        copy(src_dep, dest_dep_dir)
-
-  if is_win() and not 'Debug' in target_dir:
-    for file_path in list_file(path.join(dest_dir, target_dir)):
-      if file_path.endswith('.pdb'):
-        remove(file_path)
+  deps = resolve_runtime_deps(src_dir, target_dir, CHROME_DEPS_TARGET)
+  resolve_seconds = time.perf_counter() - start_time
+
+  for dest_dep_dir in set([path.dirname(path.join(dest_dir, x)) for x in deps]):
+    mkdir(dest_dep_dir)
+  with ThreadPoolExecutor(PACK_THREADS) as executor:
+    methods = list(executor.map(
+        lambda x: clone_file(deps[x], path.join(dest_dir, x), hardlink), deps))
+  total_bytes = sum([path.getsize(x) for x in deps.values()])
+  print('Packaged %d files (%.1f MB) in %.1fs, resolved the deps in %.1fs: '
+        '%d hardlinked, %d reflinked, %d copied' %
+        (len(deps), total_bytes / 2**20, time.perf_counter() - start_time, resolve_seconds,
+         methods.count('hardlink'), methods.count('reflink'), methods.count('copy')))
+  return deps
 
 
 def update_aquarium_deps(src_dir):
@@ -224,33 +508,68 @@ def update_aquarium_deps(src_dir):
   print('\nChanged dependent Dawn revision to its latest master branch')
 
 
-def main():
-  args = parse_arguments()
+def build_target(args, target):
+  # Each target has its own copy of the arguments when they are built in parallel.
+  args = argparse.Namespace(**vars(args))
+  args.build_type = target.lower().split('_')[0]
+  args.target_dir = path.join('out', target)
+  args.name = target if args.parallel else None
+  args.ninja_args = ['-j', str(args.jobs)] if args.jobs else []
+  if args.parallel:
+    # ninja can't change its jobs while running, the load limit shares the CPUs
+    # between the targets instead of splitting the jobs up front.
+    args.ninja_args += ['-l', str(os.cpu_count())]
+  with trace_span('build %s %s' % (args.project, target), 'build'):
+    globals()['build_' + args.project](args)
+
+
+def main(argv=None):
+  args = parse_arguments(argv)
 
   if args.update:
-    execute(['git', 'checkout', '.'], dir=args.src_dir)
-    execute(['git', 'fetch', 'origin'], dir=args.src_dir)
-    execute(['git', 'rebase', 'origin/master'], dir=args.src_dir)
-
-    if args.project != 'mesa':
-      if args.project == 'aquarium':
-        update_aquarium_deps(args.src_dir)
-      execute(['gclient', 'sync', '-D'], dir=args.src_dir)
-
-  for target in args.target:
-    args.build_type = target.lower().split('_')[0]
-    args.target_dir = path.join('out', target)
-    globals()['build_' + args.project](args)
+    with trace_span('update ' + args.project, 'build'):
+      execute(['git', 'checkout', '.'], dir=args.src_dir)
+      execute(['git', 'fetch', 'origin'], dir=args.src_dir)
+      execute(['git', 'rebase', 'origin/master'], dir=args.src_dir)
+
+      if args.project != 'mesa':
+        if args.project == 'aquarium':
+          update_aquarium_deps(args.src_dir)
+        execute(['gclient', 'sync', '-D'], dir=args.src_dir)
+
+  if args.parallel:
+    with ThreadPoolExecutor(len(args.target)) as executor:
+      futures = [executor.submit(build_target, args, target) for target in args.target]
+      for future in futures:
+        future.result()
+  else:
+    for target in args.target:
+      build_target(args, target)
   
   if args.prefix or args.zip:
-    if args.project == 'chrome':
-      pack_chrome(args.src_dir, args.target_dir, args.pack_dir)
-    elif args.project == 'mesa':
-      execute(['ninja', '-C', args.target_dir, 'install'], dir=args.src_dir)
+    # Only one target can be packaged.
+    target_dir = path.join('out', args.target[0])
+    with trace_span('package ' + args.project, 'build'):
+      if args.project == 'chrome' and args.prefix:
+        deps = pack_chrome(args.src_dir, target_dir, args.pack_dir, args.hardlink)
+      elif args.project == 'chrome':
+        deps = resolve_runtime_deps(args.src_dir, target_dir, CHROME_DEPS_TARGET)
+      elif args.project == 'mesa':
+        execute(['ninja', '-C', target_dir, 'install'], dir=args.src_dir)
 
     if args.zip:
-      zip(args.zip, args.pack_dir)
-      if not args.prefix:
+      start_time = time.perf_counter()
+      store_ext = ZIP_STORE_EXT if args.zip_store else []
+      with trace_span('zip ' + path.basename(args.zip), 'build'):
+        if args.project == 'chrome':
+          zip_infos = zip_files(args.zip, deps, store_ext)
+        else:
+          zip_infos = zip(args.zip, args.pack_dir, store_ext)
+      print('\nZipped %d files (%.1f MB) to %.1f MB in %.1fs, %d stored without compression' %
+            (len(zip_infos), sum([x.file_size for x in zip_infos]) / 2**20,
+             path.getsize(args.zip) / 2**20, time.perf_counter() - start_time,
+             len([x for x in zip_infos if x.compress_type == zipfile.ZIP_STORED])))
+      if not args.prefix and args.pack_dir:
         remove(args.pack_dir)
 
 
@@ -1,26 +1,78 @@
 #!/usr/bin/env python3
 
 import argparse
+import hashlib
+import math
+import pickle
+
+from array import array
+from concurrent.futures import ProcessPoolExecutor
 
 from util.base_util import *
 from util.file_util import *
 
-PATTERN_UNITTEST_RESULT_FAIL          = r'^\d+ test(s?) failed:$'
-PATTERN_UNITTEST_RESULT_FAIL_EXPECTED = r'^\d+ test(s?) failed as expected:$'
-PATTERN_UNITTEST_RESULT_CRASH         = r'^\d+ test(s?) crashed:$'
-PATTERN_UNITTEST_RESULT_TIMEOUT       = r'^\d+ test(s?) timed out:$'
-PATTERN_UNITTEST_RESULT_SKIP          = r'^\d+ test(s?) not run:$'
-PATTERN_UNITTEST_CASE  = r'^\[\d+/\d+\] (.+) \(\d+ ms\)$'
-PATTERN_UNITTEST_ERROR = r'^(.+) \(.+:\d+\)$'
+PATTERN_UNITTEST_RESULT = r'^\d+ tests? (failed|failed as expected|crashed|timed out|not run):$'
+PATTERN_UNITTEST_CASE   = r'^\[\d+/\d+\] (.+) \((\d+) ms\)$'
+PATTERN_UNITTEST_ERROR  = r'^(.+) \(.+:\d+\)$'
+PATTERN_UNITTEST_OVER   = r'^Tests took \d+ seconds?\.$'
 
-PATTERN_GTEST_RESULT_OK   = r'^\[\s+OK\s+\] ([\w\./<>]+) \(\d+ ms\)$'
-PATTERN_GTEST_RESULT_SKIP = r'^\[\s+SKIPPED\s+\] ([\w\./<>]+) \(\d+ ms\)$'
-PATTERN_GTEST_RESULT_FAIL = r'^\[\s+FAILED\s+\] ([\w\./<>]+), .+ \(\d+ ms\)$'
-PATTERN_GTEST_RESULT_OVER = r'^\[=+\] \d+ tests from \d+ test suites ran\. \(\d+ ms total\)$'
+PATTERN_GTEST_RESULT_OK   = r'^\[\s+OK\s+\] ([\w\./<>]+) \((\d+) ms\)$'
+PATTERN_GTEST_RESULT_SKIP = r'^\[\s+SKIPPED\s+\] ([\w\./<>]+) \((\d+) ms\)$'
+PATTERN_GTEST_RESULT_FAIL = r'^\[\s+FAILED\s+\] ([\w\./<>]+), .+ \((\d+) ms\)$'
+PATTERN_GTEST_RESULT_OVER = r'^\[=+\] \d+ tests? from \d+ test suites? ran\. \(\d+ ms total\)$'
 
 PATTERN_AVERAGE_FPS = r'^Avg FPS: (\d+)$'
 
-def parse_arguments():
+# Increase the version whenever the parsing result changes, so the cache is invalidated.
+PARSER_VERSION = 3
+PARSE_CACHE_DIR = path.join(get_home_dir(), '.cache', 'gpu_test_tools', 'parse_result')
+PARSE_CACHE_MAX_SIZE = 512 * 1024 * 1024
+
+# Test name -> test case -> duration in seconds, the moving average of the runs.
+DURATION_DB_FILE = path.join(get_home_dir(), '.cache', 'gpu_test_tools', 'test_duration.json')
+DURATION_DB_WEIGHT = 0.5
+
+# run_gpu_test writes this file next to the log when the shard is killed by the watchdog.
+TIMEOUT_EXT = '.timeout'
+# The resource usage of the test processes, which is sampled by run_gpu_test.
+RESOURCE_EXT = '.resource'
+
+UNITTEST_RESULT_TYPE = {
+  'failed':             'fail',
+  'failed as expected': 'fail_expected',
+  'crashed':            'crash',
+  'timed out':          'timeout',
+  'not run':            'skip',
+}
+
+# The log lines are classified by their prefix first, then only the pattern of
+# that class is matched. Most lines don't start with '[' or a digit at all.
+UNITTEST_RESULT_MATCHER = re.compile(PATTERN_UNITTEST_RESULT)
+UNITTEST_CASE_MATCHER   = re.compile(PATTERN_UNITTEST_CASE)
+UNITTEST_ERROR_MATCHER  = re.compile(PATTERN_UNITTEST_ERROR)
+GTEST_RESULT_MATCHER = {
+  'OK':      re.compile(PATTERN_GTEST_RESULT_OK),
+  'SKIPPED': re.compile(PATTERN_GTEST_RESULT_SKIP),
+  'FAILED':  re.compile(PATTERN_GTEST_RESULT_FAIL),
+}
+GTEST_OVER_MATCHER = re.compile(PATTERN_GTEST_RESULT_OVER)
+
+# The last line that the test launcher prints, the log is incomplete without it.
+LOG_END_MATCHER = {
+  'gpu':   re.compile(PATTERN_UNITTEST_OVER),
+  'angle': re.compile(PATTERN_UNITTEST_OVER),
+  'dawn':  GTEST_OVER_MATCHER,
+}
+
+RESULT_FLAG_RUN      = 0x01
+RESULT_FLAG_PASS     = 0x02
+RESULT_FLAG_FLAKY    = 0x04
+RESULT_FLAG_TIMEOUT  = 0x08
+RESULT_FLAG_CRASH    = 0x10
+RESULT_FLAG_EXPECTED = 0x20
+RESULT_FLAG_REMOVED  = 0x40
+
+def parse_arguments(argv=None):
   config = load_tryjob_config()
   module_set = set()
   for _, test_type, _, _ in config['tryjob']:
@@ -34,10 +86,25 @@ def parse_arguments():
       help='What type of test result to parse, you can specify multiple. Default is all except aquarium.\n\n')
   parser.add_argument('--result-dir', '--dir', '-d', default='.',
       help='The directory where the result files are located. Default is current directory.\n\n')
-  args = parser.parse_args()
+  parser.add_argument('--jobs', '-j', default=1, type=int,
+      help='The number of processes to parse the result files in parallel. Default is 1.\n\n')
+  parser.add_argument('--cache-dir', default=PARSE_CACHE_DIR,
+      help='Where to cache the parsed results. The files that are not changed won\'t be parsed again.\n'\
+           'Default is "%s".\n\n' % PARSE_CACHE_DIR)
+  parser.add_argument('--no-cache', action='store_true',
+      help='Do not read or write the cache.\n\n')
+  parser.add_argument('--update-durations', action='store_true',
+      help='Update the test durations in "%s" with this result.\n'\
+           'run_gpu_test --balance-shards uses them to balance the shards.\n\n' % DURATION_DB_FILE)
+  parser.add_argument('--format', '-f', choices=['text', 'json'], default='text',
+      help='The format of the report. Default is "text".\n'\
+           'The "json" format contains the counts of each test suite and the records of new and flaky tests.\n\n')
+  args = parser.parse_args(argv)
 
   if 'aquarium' in args.result_type and len(args.result_type) > 1:
     raise Exception('Can not merge aquarium result with others')
+  if args.jobs < 1:
+    raise Exception('Invalid jobs number: %d' % args.jobs)
 
   args.result_order, args.module_to_name = [], defaultdict(list)
   for test_name, test_type, _, _ in config['tryjob']:
@@ -45,6 +112,7 @@ def parse_arguments():
     args.module_to_name[test_type[0]].append(test_name)
 
   args.result_dir = path.abspath(args.result_dir)
+  args.cache_dir = None if args.no_cache else path.abspath(args.cache_dir)
   return args
 
 
@@ -54,62 +122,159 @@ class PerfResult(object):
     self.average_fps = None
 
 
+def result_flag_property(flag):
+  def getter(self):
+    return bool(self.flags & flag)
+
+  def setter(self, value):
+    self.flags = self.flags | flag if value else self.flags & ~flag
+  return property(getter, setter)
+
+
 class TestResult(object):
+  # Test names are interned so that the repeated runs of a test share the string.
+  # The result and the boolean attributes are packed into the bits of flags.
+  __slots__ = ['name', 'suite_name', 'flags', 'retry', 'duration']
+
   def __init__(self, name):
-    self.name = name
+    self.name = sys.intern(name)
     self.suite_name = None
-    # True->Pass; False->Fail; None->Skip
-    self.result = None
+    self.flags = 0
     self.retry = 0
-    self.is_flaky = False
-    self.is_timeout = False
-    self.is_crash = False
-    self.is_expected = False
     self.duration = None
 
+  # True->Pass; False->Fail; None->Skip
+  @property
+  def result(self):
+    return bool(self.flags & RESULT_FLAG_PASS) if self.flags & RESULT_FLAG_RUN else None
+
+  @result.setter
+  def result(self, value):
+    self.flags &= ~(RESULT_FLAG_RUN | RESULT_FLAG_PASS)
+    if value is not None:
+      self.flags |= RESULT_FLAG_RUN | (RESULT_FLAG_PASS if value else 0)
+
+  is_flaky    = result_flag_property(RESULT_FLAG_FLAKY)
+  is_timeout  = result_flag_property(RESULT_FLAG_TIMEOUT)
+  is_crash    = result_flag_property(RESULT_FLAG_CRASH)
+  is_expected = result_flag_property(RESULT_FLAG_EXPECTED)
+
+
+class TestResultView(object):
+  def __init__(self, test_suite, mask, value):
+    self.test_suite = test_suite
+    self.mask = mask
+    self.value = value
+
+  def __len__(self):
+    mask, value = self.mask, self.value
+    return sum(1 for flags in self.test_suite.flags if flags & mask == value)
+
+  def __bool__(self):
+    mask, value = self.mask, self.value
+    return match_any(self.test_suite.flags, lambda x: x & mask == value)
+
+  def __iter__(self):
+    mask, value = self.mask, self.value
+    for row, flags in enumerate(self.test_suite.flags):
+      if flags & mask == value:
+        yield self.test_suite.GetResult(row)
+
 
 class TestSuite(object):
+  # The results are stored in columns with one row per result in the order they
+  # are added. TestResult objects are only created when the results are read.
   def __init__(self, name):
     self.name = name
-    self.actual_pass = []
-    self.actual_fail = []
-    self.skip = []
-    self.flaky_pass = []
-    self.unexpected_pass = []
-    self.unexpected_fail = []
+    self.suite_names = [name]
+    self.names = []
+    self.suites = array('H')
+    self.flags = array('B')
+    self.retries = array('H')
+    self.durations = array('d')
+    # Test name -> rows of the result, it's built on demand.
+    self.name_index = None
 
   def __iadd__(self, other):
-    self.actual_pass += other.actual_pass
-    self.actual_fail += other.actual_fail
-    self.skip += other.skip
-    self.flaky_pass += other.flaky_pass
-    self.unexpected_pass += other.unexpected_pass
-    self.unexpected_fail += other.unexpected_fail
+    suite_map = []
+    for suite_name in other.suite_names:
+      if not suite_name in self.suite_names:
+        self.suite_names.append(suite_name)
+      suite_map.append(self.suite_names.index(suite_name))
+    self.names += other.names
+    self.suites.extend(suite_map[x] for x in other.suites)
+    self.flags += other.flags
+    self.retries += other.retries
+    self.durations += other.durations
+    self.name_index = None
     return self
 
   def __bool__(self):
-    return bool(self.actual_pass) or bool(self.actual_fail) or bool(self.skip)
+    return match_any(self.flags, lambda x: not x & RESULT_FLAG_REMOVED)
+
+  @property
+  def actual_pass(self):
+    return TestResultView(self, RESULT_FLAG_RUN | RESULT_FLAG_PASS | RESULT_FLAG_REMOVED,
+                          RESULT_FLAG_RUN | RESULT_FLAG_PASS)
+
+  @property
+  def actual_fail(self):
+    return TestResultView(self, RESULT_FLAG_RUN | RESULT_FLAG_PASS, RESULT_FLAG_RUN)
+
+  @property
+  def skip(self):
+    return TestResultView(self, RESULT_FLAG_RUN, 0)
+
+  @property
+  def flaky_pass(self):
+    return TestResultView(
+        self,
+        RESULT_FLAG_RUN | RESULT_FLAG_PASS | RESULT_FLAG_REMOVED | RESULT_FLAG_EXPECTED | RESULT_FLAG_FLAKY,
+        RESULT_FLAG_RUN | RESULT_FLAG_PASS | RESULT_FLAG_EXPECTED | RESULT_FLAG_FLAKY)
+
+  @property
+  def unexpected_pass(self):
+    return TestResultView(
+        self, RESULT_FLAG_RUN | RESULT_FLAG_PASS | RESULT_FLAG_REMOVED | RESULT_FLAG_EXPECTED,
+        RESULT_FLAG_RUN | RESULT_FLAG_PASS)
+
+  @property
+  def unexpected_fail(self):
+    return TestResultView(self, RESULT_FLAG_RUN | RESULT_FLAG_PASS | RESULT_FLAG_EXPECTED,
+                          RESULT_FLAG_RUN)
+
+  def GetNameIndex(self):
+    if self.name_index is None:
+      self.name_index = defaultdict(list)
+      for row, name in enumerate(self.names):
+        if not self.flags[row] & RESULT_FLAG_REMOVED:
+          self.name_index[name].append(row)
+    return self.name_index
+
+  def GetResult(self, row):
+    result = TestResult(self.names[row])
+    result.suite_name = self.suite_names[self.suites[row]]
+    result.flags = self.flags[row]
+    result.retry = self.retries[row]
+    duration = self.durations[row]
+    result.duration = None if math.isnan(duration) else duration
+    return result
 
   def AddResult(self, result):
     result.suite_name = self.name
-    if result.result is None:
-      self.skip.append(result)
-    elif result.result:
-      self.actual_pass.append(result)
-      if not result.is_expected:
-        self.unexpected_pass.append(result)
-      elif result.is_flaky:
-        self.flaky_pass.append(result)
-    else:
-      self.actual_fail.append(result)
-      if not result.is_expected:
-        self.unexpected_fail.append(result)
+    if self.name_index is not None:
+      self.name_index[result.name].append(len(self.names))
+    self.names.append(result.name)
+    self.suites.append(0)
+    self.flags.append(result.flags)
+    self.retries.append(result.retry)
+    self.durations.append(math.nan if result.duration is None else result.duration)
 
   def RemovePass(self, name):
-    for pass_list in [self.actual_pass, self.unexpected_pass, self.flaky_pass]:
-      index = index_match(pass_list, lambda x: x.name == name)
-      if index >= 0:
-        pass_list.pop(index)
+    rows = self.GetNameIndex().get(name, [])
+    index = index_match(rows, lambda x: self.flags[x] & RESULT_FLAG_PASS)
+    if index >= 0:
+      self.flags[rows.pop(index)] |= RESULT_FLAG_REMOVED
 
 
 def parse_json_result(name, value):
@@ -146,89 +311,251 @@ def parse_json_result(name, value):
   return test_result
 
 
-def parse_json_result_dict(result_dict, test_suite, prefix=''):
-  for key, value in result_dict.items():
-    if 'actual' in value and 'expected' in value:
-      test_suite.AddResult(parse_json_result(prefix + key, value))
+def get_result_name(result_file):
+  file_name = path.basename(result_file)
+  if file_name.endswith(COMPRESSED_EXT):
+    file_name = file_name[:-len(COMPRESSED_EXT)]
+  return path.splitext(file_name)[0]
+
+
+def add_json_results(test_suite, prefix, tests):
+  for key, value in tests.items():
+    if not isinstance(value, dict):
+      continue
+    if 'actual' in value or 'expected' in value:
+      if 'actual' in value and 'expected' in value:
+        test_suite.AddResult(parse_json_result(prefix + key, value))
     else:
-      parse_json_result_dict(value, test_suite, prefix + key + '/')
+      add_json_results(test_suite, prefix + key + '/', value)
 
 
 def parse_json_result_file(result_file):
-  result_name, _ = path.splitext(path.basename(result_file))
+  result_name = get_result_name(result_file)
   test_suite = TestSuite(result_name)
-  parse_json_result_dict(read_json(result_file)['tests'], test_suite)
+  # Walk the events of "tests" with a stack of (child prefix, test name, values).
+  # A map that has "actual" and "expected" is a test, it's added once the map ends.
+  # The maps under "tests" are decoded as a whole if they are small enough, then
+  # they are walked by add_json_results().
+  stack, key, depth, skip_depth = [], None, 0, 0
+  for event, value in read_json_event(result_file, decode_depth=3):
+    if event == 'map_key':
+      key = value
+    elif event == 'value':
+      if not stack or skip_depth:
+        continue
+      values = stack[-1][2]
+      if isinstance(value, dict) and not ('actual' in values or 'expected' in values):
+        add_json_results(test_suite, stack[-1][0], {key: value})
+      else:
+        values[key] = value
+    elif event == 'start_map':
+      depth += 1
+      if skip_depth:
+        skip_depth += 1
+      elif depth == 2 and key == 'tests':
+        stack.append(('', None, {}))
+      elif stack and not ('actual' in stack[-1][2] or 'expected' in stack[-1][2]):
+        prefix = stack[-1][0]
+        stack.append((prefix + key + '/', prefix + key, {}))
+      elif depth > 1:
+        skip_depth = 1
+    elif event == 'end_map':
+      depth -= 1
+      if skip_depth:
+        skip_depth -= 1
+      elif stack:
+        _, name, values = stack.pop()
+        if 'actual' in values and 'expected' in values:
+          test_suite.AddResult(parse_json_result(name, values))
   return test_suite
 
 
-def parse_unittest_result_file(result_file):
-  result_name, _ = path.splitext(path.basename(result_file))
-  test_suite = TestSuite(result_name)
-  error_result = ''
-  for line in read_line(result_file):
-    if error_result:
-      match = re_match(PATTERN_UNITTEST_ERROR, line)
-      if match:
-        result = TestResult(match.group(1))
-        if error_result != 'skip':
-          result.result = False
-          result.is_timeout = error_result == 'timeout'
-          result.is_crash = error_result == 'crash'
-          result.is_expected = error_result == 'fail_expected'
-        test_suite.RemovePass(result.name)
-        test_suite.AddResult(result)
+class UnittestResultParser(object):
+  def __init__(self, name):
+    self.test_suite = TestSuite(name)
+    self.error_result = ''
+
+  def ParseLine(self, line):
+    self.ParseLines([line])
+
+  def ParseLines(self, lines):
+    test_suite, error_result = self.test_suite, self.error_result
+    for line in lines:
+      if error_result:
+        match = UNITTEST_ERROR_MATCHER.match(line)
+        if match:
+          result = TestResult(match.group(1))
+          if error_result != 'skip':
+            result.result = False
+            result.is_timeout = error_result == 'timeout'
+            result.is_crash = error_result == 'crash'
+            result.is_expected = error_result == 'fail_expected'
+          test_suite.RemovePass(result.name)
+          test_suite.AddResult(result)
+          continue
+      elif line.startswith('['):
+        match = UNITTEST_CASE_MATCHER.match(line)
+        if match:
+          result = TestResult(match.group(1))
+          result.result = True
+          result.is_expected = True
+          result.duration = int(match.group(2)) / 1000
+          test_suite.AddResult(result)
+          continue
+
+      if line[:1].isdigit():
+        match = UNITTEST_RESULT_MATCHER.match(line)
+        if match:
+          error_result = self.error_result = UNITTEST_RESULT_TYPE[match.group(1)]
+
+
+class GtestResultParser(object):
+  def __init__(self, name):
+    self.test_suite = TestSuite(name)
+    self.is_over = False
+
+  def ParseLine(self, line):
+    self.ParseLines([line])
+
+  def ParseLines(self, lines):
+    if self.is_over:
+      return
+    test_suite = self.test_suite
+    for line in lines:
+      if not line.startswith('['):
         continue
-    else:
-      match = re_match(PATTERN_UNITTEST_CASE, line)
+      if line.startswith('[='):
+        if GTEST_OVER_MATCHER.match(line):
+          self.is_over = True
+          return
+        continue
+
+      status = line[1:line.find(']')].strip()
+      matcher = GTEST_RESULT_MATCHER.get(status)
+      match = matcher.match(line) if matcher else None
       if match:
         result = TestResult(match.group(1))
-        result.result = True
-        result.is_expected = True
+        result.duration = int(match.group(2)) / 1000
+        if status == 'OK':
+          result.result = True
+          result.is_expected = True
+        elif status == 'FAILED':
+          result.result = False
         test_suite.AddResult(result)
-        continue
 
-    if re_match(PATTERN_UNITTEST_RESULT_FAIL, line):
-      error_result = 'fail'
-    elif re_match(PATTERN_UNITTEST_RESULT_FAIL_EXPECTED, line):
-      error_result = 'fail_expected'
-    elif re_match(PATTERN_UNITTEST_RESULT_CRASH, line):
-      error_result = 'crash'
-    elif re_match(PATTERN_UNITTEST_RESULT_TIMEOUT, line):
-      error_result = 'timeout'
-    elif re_match(PATTERN_UNITTEST_RESULT_SKIP, line):
-      error_result = 'skip'
-  return test_suite
+
+def create_log_result_parser(module, name):
+  if module in ['gpu', 'angle']:
+    return UnittestResultParser(name)
+  elif module in ['dawn']:
+    return GtestResultParser(name)
+
+
+def parse_unittest_result_file(result_file):
+  parser = UnittestResultParser(get_result_name(result_file))
+  parser.ParseLines(read_line(result_file))
+  return parser.test_suite
 
 
 def parse_gtest_result_file(result_file):
-  result_name, _ = path.splitext(path.basename(result_file))
-  test_suite = TestSuite(result_name)
-  for line in read_line(result_file):
-    if re_match(PATTERN_GTEST_RESULT_OVER, line):
-      break
-    match = re_match(PATTERN_GTEST_RESULT_OK, line)
-    if match:
-      result = TestResult(match.group(1))
-      result.result = True
-      result.is_expected = True
-      test_suite.AddResult(result)
-      continue
-    match = re_match(PATTERN_GTEST_RESULT_SKIP, line)
-    if match:
-      result = TestResult(match.group(1))
-      test_suite.AddResult(result)
-      continue
-    match = re_match(PATTERN_GTEST_RESULT_FAIL, line)
-    if match:
-      result = TestResult(match.group(1))
-      result.result = False
-      test_suite.AddResult(result)
-      continue
+  parser = GtestResultParser(get_result_name(result_file))
+  parser.ParseLines(read_line(result_file))
+  return parser.test_suite
+
+
+def get_parse_cache_file(cache_dir, result_file):
+  return path.join(cache_dir, hashlib.sha1(result_file.encode()).hexdigest() + '.pickle')
+
+
+def get_parse_cache_key(module, result_file):
+  file_stat = os.stat(result_file)
+  return (result_file, module, file_stat.st_size, file_stat.st_mtime_ns, PARSER_VERSION)
+
+
+def load_parse_cache(module, result_file, cache_dir):
+  try:
+    cache_file = get_parse_cache_file(cache_dir, result_file)
+    with open(cache_file, 'rb') as f:
+      key, test_suite = pickle.load(f)
+    if key == get_parse_cache_key(module, result_file):
+      # Refresh the modification time, the cache is evicted in LRU order.
+      os.utime(cache_file)
+      return test_suite
+  except Exception:
+    pass
+  return None
+
+
+def save_parse_cache(module, result_file, test_suite, cache_dir):
+  cache_file = get_parse_cache_file(cache_dir, result_file)
+  cache_key = get_parse_cache_key(module, result_file)
+  test_suite.name_index = None
+  mkdir(cache_dir)
+  write_file_atomic(cache_file, pickle.dumps((cache_key, test_suite), pickle.HIGHEST_PROTOCOL))
+
+
+def parse_test_result_file(module, result_file, cache_dir=None):
+  if cache_dir:
+    test_suite = load_parse_cache(module, result_file, cache_dir)
+    if test_suite is not None:
+      return test_suite
+
+  if module in ['content', 'blink']:
+    test_suite = parse_json_result_file(result_file)
+  elif module in ['gpu', 'angle']:
+    test_suite = parse_unittest_result_file(result_file)
+  elif module in ['dawn']:
+    test_suite = parse_gtest_result_file(result_file)
+
+  if cache_dir:
+    save_parse_cache(module, result_file, test_suite, cache_dir)
   return test_suite
 
 
+def evict_parse_cache(cache_dir, max_size):
+  if not path.exists(cache_dir):
+    return
+  cache_files = []
+  for file_path in list_file(cache_dir):
+    try:
+      cache_files.append((os.stat(file_path), file_path))
+    except OSError:
+      pass
+
+  total_size = 0
+  for file_stat, file_path in sorted(cache_files, key=lambda x: x[0].st_mtime, reverse=True):
+    total_size += file_stat.st_size
+    if total_size > max_size:
+      remove(file_path)
+
+
+def load_duration_db(db_file=DURATION_DB_FILE):
+  try:
+    return read_json(db_file)
+  except (OSError, ValueError):
+    return {}
+
+
+def update_duration_db(test_suites, db_file=DURATION_DB_FILE):
+  # The runs are merged in order, so the latest run has the most weight.
+  duration_db = load_duration_db(db_file)
+  for test_suite in test_suites:
+    durations = duration_db.setdefault(test_suite.name, {})
+    for row, name in enumerate(test_suite.names):
+      duration = test_suite.durations[row]
+      if math.isnan(duration):
+        continue
+      last_duration = durations.get(name)
+      if last_duration is not None:
+        duration = last_duration + (duration - last_duration) * DURATION_DB_WEIGHT
+      durations[name] = round(duration, 3)
+
+  mkdir(path.dirname(db_file))
+  write_file_atomic(db_file, json.dumps(duration_db, indent=0, sort_keys=True))
+
+
 def parse_aquarium_result_file(result_file):
-  result_name, _ = path.splitext(path.basename(result_file))
+  result_name = get_result_name(result_file)
   for line in read_line(result_file):
     match = re_match(PATTERN_AVERAGE_FPS, line)
     if match:
@@ -237,92 +564,219 @@ def parse_aquarium_result_file(result_file):
       return result
 
 
-def generate_test_report(test_suites):
-  max_name_len = 0
+def generate_test_summary(test_suites, timeout_records=[], resource_records=[]):
+  def test_record(test_result):
+    return {
+      'suite':      test_result.suite_name,
+      'name':       test_result.name,
+      'retry':      test_result.retry,
+      'is_timeout': test_result.is_timeout,
+      'is_crash':   test_result.is_crash,
+      'duration':   test_result.duration,
+    }
+
+  summary = {'suites': [], 'new_fail': [], 'new_pass': [], 'flaky_pass': [],
+             'timeout': timeout_records, 'resource': resource_records}
   for test_suite in test_suites:
-    max_name_len = max(max_name_len, len(test_suite.name))
+    summary['suites'].append({
+      'name':       test_suite.name,
+      'pass':       len(test_suite.actual_pass),
+      'fail':       len(test_suite.actual_fail),
+      'skip':       len(test_suite.skip),
+      'flaky_pass': len(test_suite.flaky_pass),
+      'new_pass':   len(test_suite.unexpected_pass),
+      'new_fail':   len(test_suite.unexpected_fail),
+    })
+    summary['new_fail'] += [test_record(x) for x in test_suite.unexpected_fail]
+    summary['new_pass'] += [test_record(x) for x in test_suite.unexpected_pass]
+    summary['flaky_pass'] += [test_record(x) for x in test_suite.flaky_pass]
+  return summary
+
+
+def render_test_report(summary):
+  max_name_len = 0
+  for suite in summary['suites']:
+    max_name_len = max(max_name_len, len(suite['name']))
   name_format = '{:<%d}' % (max_name_len+2)
   report = 'Test Result:\n'
-  for test_suite in test_suites:
-    report += name_format.format(test_suite.name)
-    report += '{:<14}'.format('[Pass:%d]' % len(test_suite.actual_pass))
-    report += '{:<11}'.format('[Fail:%d]' % len(test_suite.actual_fail))
-    report += '{:<11}'.format('[Skip:%d]' % len(test_suite.skip))
-    report += '{:<17}'.format('[Flaky Pass:%d]' % len(test_suite.flaky_pass))
-    report += '{:<15}'.format('[New Pass:%d]' % len(test_suite.unexpected_pass))
-    report += '[New Fail:%d]\n' % len(test_suite.unexpected_fail)
-
-  if match_any(test_suites, lambda x: x.unexpected_fail):
+  for suite in summary['suites']:
+    report += name_format.format(suite['name'])
+    report += '{:<14}'.format('[Pass:%d]' % suite['pass'])
+    report += '{:<11}'.format('[Fail:%d]' % suite['fail'])
+    report += '{:<11}'.format('[Skip:%d]' % suite['skip'])
+    report += '{:<17}'.format('[Flaky Pass:%d]' % suite['flaky_pass'])
+    report += '{:<15}'.format('[New Pass:%d]' % suite['new_pass'])
+    report += '[New Fail:%d]\n' % suite['new_fail']
+
+  if summary['new_fail']:
     report += '\nNew Fail:\n'
-    for test_suite in test_suites:
-      for test_result in test_suite.unexpected_fail:
-        report += '%s    %s\n' % (test_result.suite_name, test_result.name)
+    for record in summary['new_fail']:
+      report += '%s    %s\n' % (record['suite'], record['name'])
 
-  if match_any(test_suites, lambda x: x.unexpected_pass and not x.name.startswith('webgpu')):
+  new_pass = [x for x in summary['new_pass'] if not x['suite'].startswith('webgpu')]
+  if new_pass:
     report += '\nNew Pass:\n'
-    for test_suite in test_suites:
-      if not test_suite.name.startswith('webgpu'):
-        for test_result in test_suite.unexpected_pass:
-          report += '%s    %s\n' % (test_result.suite_name, test_result.name)
-  
-  if match_any(test_suites, lambda x: x.flaky_pass):
+    for record in new_pass:
+      report += '%s    %s\n' % (record['suite'], record['name'])
+
+  if summary['flaky_pass']:
     report += '\nFlaky Pass:\n'
-    for test_suite in test_suites:
-      for test_result in test_suite.flaky_pass:
-        report += '%s    %s\n' % (test_result.suite_name, test_result.name)
+    for record in summary['flaky_pass']:
+      report += '%s    %s\n' % (record['suite'], record['name'])
+
+  if summary.get('timeout'):
+    report += '\nTimed Out:\n'
+    for record in summary['timeout']:
+      if record['reason'] == 'inactivity':
+        report += '%s    No output for %gs' % (record['name'], record['timeout'])
+      else:
+        report += '%s    Ran out of %gs' % (record['name'], record['timeout'])
+      report += ', last line: %s\n' % record['last_line'] if record['last_line'] else '\n'
+
+  if summary.get('resource'):
+    max_name_len = max(len(x['name']) for x in summary['resource'])
+    name_format = '{:<%d}' % (max_name_len+2)
+    report += '\nResource Usage:\n'
+    for record in summary['resource']:
+      report += name_format.format(record['name'])
+      report += '{:<15}'.format('[Time:%s]' % format_seconds(record['elapsed']))
+      report += '{:<14}'.format('[CPU:%s]' % format_seconds(record['cpu']))
+      report += '{:<16}'.format('[Peak CPU:%d%%]' % record['peak_cpu_percent'])
+      report += '{:<18}'.format('[Peak RSS:%s]' % format_bytes(record['peak_rss']))
+      report += '{:<14}'.format('[Read:%s]' % format_bytes(record['read_bytes']))
+      report += '{:<15}'.format('[Write:%s]' % format_bytes(record['write_bytes']))
+      report += '{:<23}'.format('[Context Switch:%d]' % record['ctx_switches'])
+      report += '{:<17}'.format('[Peak Load:%.1f]' % record['peak_load'])
+      report += '[Peak Swap:%s]\n' % format_bytes(record['peak_swap'])
   return report
 
 
-def main():
-  args = parse_arguments()
+def format_seconds(seconds):
+  return '%dm%02ds' % (seconds // 60, seconds % 60)
+
+
+def format_bytes(size):
+  for unit in ['B', 'KB', 'MB', 'GB']:
+    if size < 1024 or unit == 'GB':
+      return ('%d%s' if unit == 'B' else '%.1f%s') % (size, unit)
+    size /= 1024
 
-  def find_result_file(module):
-    result_ext = 'json' if module in ['content', 'blink'] else 'log'
-    for file_path in list_file(args.result_dir):
-      file_name = path.basename(file_path)
-      if (file_name.endswith(result_ext) and 
-          match_any(args.module_to_name[module], lambda x: file_name.startswith(x))):
-        yield file_path
 
+def generate_test_report(test_suites):
+  return render_test_report(generate_test_summary(test_suites))
+
+
+def generate_perf_summary(perf_results):
+  return {'average_fps': [{'name': x.name, 'average_fps': x.average_fps} for x in perf_results]}
+
+
+def render_perf_report(summary):
+  max_name_len = 0
+  for record in summary['average_fps']:
+    max_name_len = max(max_name_len, len(record['name']))
+  name_format = '{:<%d}' % (max_name_len+2)
+  report = 'Average FPS:\n'
+  for record in summary['average_fps']:
+    report += '%s%d' % (name_format.format(record['name']), record['average_fps'])
+    if 'bias' in record:
+      report += ' (%s%d%%)' % ('+' if record['bias'] >= 0 else '', record['bias'])
+    report += '\n'
+  return report
+
+
+def find_result_file(args, module):
+  result_ext = 'json' if module in ['content', 'blink'] else 'log'
+  for file_path in list_file(args.result_dir):
+    file_name = path.basename(file_path)
+    if (file_name.endswith((result_ext, result_ext + COMPRESSED_EXT)) and
+        match_any(args.module_to_name[module], lambda x: file_name.startswith(x))):
+      yield file_path
+
+
+def find_record_file(args, module, record_ext):
+  for file_path in list_file(args.result_dir):
+    file_name = path.basename(file_path)
+    if (file_name.endswith(record_ext) and
+        match_any(args.module_to_name[module], lambda x: file_name.startswith(x))):
+      yield file_path
+
+
+def generate_summary(args):
   if args.result_type == ['aquarium']:
     perf_results = []
-    max_name_len = 0
-    for result_file in find_result_file('aquarium'):
+    for result_file in find_result_file(args, 'aquarium'):
       result = parse_aquarium_result_file(result_file)
       if result and result.average_fps > 0:
         perf_results.append(result)
-        max_name_len = max(max_name_len, len(result.name))
-
-    if perf_results:
-      report = 'Average FPS:\n'
-      name_format = '{:<%d}' % (max_name_len+2)
-      for result in perf_results:
-        report += '%s%d\n' % (name_format.format(result.name), result.average_fps)
-      print(report, end='')
+    return generate_perf_summary(perf_results) if perf_results else None
+
+  modules, result_files = [], []
+  for module in args.result_type:
+    for result_file in find_result_file(args, module):
+      modules.append(module)
+      result_files.append(result_file)
+
+  # The results are merged in the same order as the files are listed.
+  cache_dirs = [args.cache_dir] * len(result_files)
+  if args.jobs > 1 and len(result_files) > 1:
+    with ProcessPoolExecutor(min(args.jobs, len(result_files))) as executor:
+      test_suites = list(executor.map(parse_test_result_file, modules, result_files, cache_dirs))
+  else:
+    test_suites = map(parse_test_result_file, modules, result_files, cache_dirs)
+
+  merged_result = {}
+  for test_suite in test_suites:
+    if test_suite:
+      name, ext = path.splitext(test_suite.name)
+      while ext:
+        name, ext = path.splitext(name)
+      merged_result.setdefault(name, TestSuite(name))
+      merged_result[name] += test_suite
+  if args.cache_dir:
+    evict_parse_cache(args.cache_dir, PARSE_CACHE_MAX_SIZE)
+
+  timeout_records = []
+  for module in args.result_type:
+    timeout_records += [read_json(x) for x in sorted(find_record_file(args, module, TIMEOUT_EXT))]
+  resource_usage = {}
+  for module in args.result_type:
+    for resource_file in find_record_file(args, module, RESOURCE_EXT):
+      name = path.basename(resource_file).split('.')[0]
+      usage = read_json(resource_file)['summary']
+      if name in resource_usage:
+        for key, value in usage.items():
+          merge = max if key.startswith('peak_') else lambda x, y: x + y
+          resource_usage[name][key] = merge(resource_usage[name][key], value)
+      else:
+        resource_usage[name] = usage
+  resource_records = [dict(name=x, **resource_usage[x])
+                      for x in args.result_order if x in resource_usage]
+
+  if not merged_result and not timeout_records:
+    return None
+
+  sorted_suites = []
+  for name in args.result_order:
+    if name in merged_result:
+      sorted_suites.append(merged_result.pop(name))
+  assert not merged_result
+  if args.update_durations:
+    update_duration_db(sorted_suites)
+  return generate_test_summary(sorted_suites, timeout_records, resource_records)
+
+
+def main(argv=None):
+  args = parse_arguments(argv)
+  summary = generate_summary(args)
+  if not summary:
+    return
+
+  if args.format == 'json':
+    print(json.dumps(summary))
+  elif args.result_type == ['aquarium']:
+    print(render_perf_report(summary), end='')
   else:
-    merged_result = {}
-    for module in args.result_type:
-      for result_file in find_result_file(module):
-        if module in ['content', 'blink']:
-          test_suite = parse_json_result_file(result_file)
-        elif module in ['gpu', 'angle']:
-          test_suite = parse_unittest_result_file(result_file)
-        elif module in ['dawn']:
-          test_suite = parse_gtest_result_file(result_file)
-        if test_suite:
-          name, ext = path.splitext(test_suite.name)
-          while ext:
-            name, ext = path.splitext(name)
-          merged_result.setdefault(name, TestSuite(name))
-          merged_result[name] += test_suite
-
-    if merged_result:
-      sorted_suites = []
-      for name in args.result_order:
-        if name in merged_result:
-          sorted_suites.append(merged_result.pop(name))
-      assert not merged_result
-      print(generate_test_report(sorted_suites), end='')
+    print(render_test_report(summary), end='')
 
 
 if __name__ == '__main__':
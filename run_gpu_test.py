@@ -1,7 +1,18 @@
 #!/usr/bin/env python3
 
 import argparse
+import fnmatch
+import hashlib
+import heapq
+import io
+import threading
 
+from concurrent.futures import ThreadPoolExecutor
+
+import parse_result
+
+from parse_result import LOG_END_MATCHER, PARSE_CACHE_DIR, create_log_result_parser, get_result_name
+from parse_result import RESOURCE_EXT, TIMEOUT_EXT, parse_test_result_file, save_parse_cache
 from util.base_util import *
 from util.file_util import *
 
@@ -12,7 +23,16 @@ WEBGL2_TEST_OUTPUT  = path.join('content', 'test', 'data', 'gpu', 'webgl2_confor
 BLINK_TEST_SCRIPT  = path.join('third_party', 'blink', 'tools', 'run_web_tests.py')
 WEBGPU_EXPECTATION = path.join('third_party', 'blink', 'web_tests', 'WebGPUExpectations')
 
-def parse_arguments():
+LIVE_STATUS_INTERVAL = 1.0
+
+# The completed runs are recorded in the current directory, see RunManifest.
+RUN_MANIFEST_FILE = 'run_manifest.json'
+FILTER_FILE_FLAG = '--test-launcher-filter-file='
+
+# By default, each failure is run this many times to check if it reproduces.
+RERUN_REPEAT = 5
+
+def parse_arguments(argv=None):
   config = load_tryjob_config()
   module_to_backend, backend_set = defaultdict(list), set()
   for _, test_type, _, _ in config['tryjob']:
@@ -42,15 +62,47 @@ def parse_arguments():
   parser.add_argument('--index', '-i', type=int,
       help='Shard index of this test.\n'\
            'By default, all shards will be run in sequence.\n\n')
-  parser.add_argument('--repeat', '-r', default=1, type=int,
-      help='The number of times to repeat running this test.\n'\
-           'For multiple shards, the running sequence will be shard0 * N times, shard1 * N times ...\n\n')
+  parser.add_argument('--parallel-shards', '-P', default=1, type=int,
+      help='The number of shards to run concurrently when all shards are run. Default is 1.\n'\
+           'The output of each shard is printed once the shard is finished.\n\n')
+  parser.add_argument('--balance-shards', '-b', action='store_true',
+      help='Give each shard an explicit list of tests balanced by the test durations of the past runs.\n'\
+           'The durations are recorded by parse_result --update-durations. Only for gpu, angle and dawn tests,\n'\
+           'the tests that are not recorded yet are run in an extra shard.\n\n')
+  parser.add_argument('--repeat', '-r', type=int,
+      help='The number of times to repeat running this test. Default is 1, or %d for --rerun-failures.\n'\
+           'For multiple shards, the running sequence will be shard0 * N times, shard1 * N times ...\n\n' % RERUN_REPEAT)
+  parser.add_argument('--rerun-failures', metavar='RESULT_DIR',
+      help='Only run the new failures of this test in RESULT_DIR, and report how often each one fails.\n'\
+           'The logs are named *.rerun.* and must not be written to RESULT_DIR.\n\n')
   parser.add_argument('--print-log', '-p', action='store_true',
       help='Print full test log when test is running.\n\n')
+  parser.add_argument('--live-parse', '-l', action='store_true',
+      help='Parse the test result while the test is running and show the live counters.\n'\
+           'The parsed result is saved to the cache of parse_result, so it won\'t be parsed again.\n\n')
+  parser.add_argument('--timeout', type=float,
+      help='The time budget in seconds of each shard, the process tree is killed when it\'s used up.\n'\
+           'Default is read from the configuration file, specify 0 to disable it.\n\n')
+  parser.add_argument('--inactivity-timeout', type=float,
+      help='Kill the process tree if the shard has no output for this many seconds.\n'\
+           'Default is read from the configuration file, specify 0 to disable it.\n\n')
+  parser.add_argument('--resume', action='store_true',
+      help='Skip the shards and repeats that have been completed in the current directory.\n'\
+           'The completed runs are recorded in "%s".\n\n' % RUN_MANIFEST_FILE)
+  parser.add_argument('--sample-interval', default=RESOURCE_SAMPLE_INTERVAL, type=float,
+      help='How often in seconds the resource usage of the test processes is sampled on Linux.\n'\
+           'The samples are written next to the log as *%s, specify 0 to disable it. Default is %g.\n\n'
+           % (RESOURCE_EXT, RESOURCE_SAMPLE_INTERVAL))
+  parser.add_argument('--compress-log', '-z', action='store_true',
+      help='Compress the test log on the fly and the result file after the test with gzip.\n\n')
+  parser.add_argument('--log-sync-interval', default=LOG_SYNC_INTERVAL, type=float,
+      help='How often in seconds the test log is synchronized to disk. Default is %g.\n'\
+           'The log is also synchronized every %dMB and when the test exits.\n'\
+           'Specify 0 to synchronize every line.\n\n' % (LOG_SYNC_INTERVAL, LOG_SYNC_BYTES // (1024 * 1024)))
   parser.add_argument('--dry-run', nargs='?', const=get_platform(), choices=['win', 'linux'],
       help='Go through the process but do not run test actually.\n'\
            'You can specify the platform (win|linux) or leave it empty to use current platform.\n\n')
-  args, extra_args = parser.parse_known_args()
+  args, extra_args = parser.parse_known_args(argv)
 
   if not args.backend in module_to_backend[args.module]:
     raise Exception('The backends that are supported by %s test are %s' %
@@ -60,6 +112,22 @@ def parse_arguments():
   test_keys = [args.module] + args.backend.split('_')
   args.test_keys = ['_'.join(test_keys[0:i]) for i in range(1, len(test_keys)+1)]
 
+  index = index_match(config['tryjob'], lambda x: x[1] == [args.module, args.backend])
+  test_name = args.test_name = config['tryjob'][index][0]
+  if args.rerun_failures:
+    if args.filter:
+      raise Exception('Do not support filter with --rerun-failures')
+    if args.module in ['aquarium']:
+      raise Exception('Do not support rerunning failures in %s test' % args.module)
+    if path.samefile(args.rerun_failures, '.'):
+      raise Exception('Please rerun the failures in another directory than ' + args.rerun_failures)
+    args.filter = find_failure_filter(args.rerun_failures, args.module, test_name)
+    if not args.filter:
+      raise Exception('No new failure of %s in %s' % (test_name, args.rerun_failures))
+    test_name += '.rerun'
+  if args.repeat is None:
+    args.repeat = RERUN_REPEAT if args.rerun_failures else 1
+
   if args.shard is None:
     if args.filter:
       args.shard = 1
@@ -67,7 +135,13 @@ def parse_arguments():
       key = find_match(args.test_keys, lambda x: x in config['shards'])
       args.shard = config['shards'][key] if key else 1
 
-  if args.filter and args.module in ['blink', 'aquarium']:
+  # The most specific key wins, e.g. 'angle_perf' over 'angle'.
+  for name in ['timeout', 'inactivity_timeout']:
+    if getattr(args, name) is None:
+      key = find_match(reversed(args.test_keys), lambda x: x in config[name])
+      setattr(args, name, config[name][key if key else 'default'])
+
+  if args.filter and not args.rerun_failures and args.module in ['blink', 'aquarium']:
     raise Exception('Do not support filter in %s test' % args.module)
   if args.shard > 1 and args.module in ['aquarium']:
     raise Exception('Do not support shard in %s test' % args.module)
@@ -77,16 +151,23 @@ def parse_arguments():
     raise Exception('Invalid index number: ' + args.index)
   if args.repeat < 1:
     raise Exception('Invalid repeat number: ' + args.repeat)
-
-  index = index_match(config['tryjob'], lambda x: x[1] == [args.module, args.backend])
-  args.log_file    = config['tryjob'][index][0] + '.log'
-  args.result_file = config['tryjob'][index][0] + '.json'
+  if args.log_sync_interval < 0:
+    raise Exception('Invalid log sync interval: %g' % args.log_sync_interval)
+  if args.parallel_shards < 1:
+    raise Exception('Invalid parallel shards number: %d' % args.parallel_shards)
+  if args.sample_interval < 0:
+    raise Exception('Invalid sample interval: %g' % args.sample_interval)
+  if args.timeout < 0 or args.inactivity_timeout < 0:
+    raise Exception('Invalid timeout: %g, %g' % (args.timeout, args.inactivity_timeout))
+
+  args.log_file    = test_name + '.log'
+  args.result_file = test_name + '.json'
 
   args.test_command = config['test_command']
   args.test_args    = config['test_args']
   args.browser_args = config['browser_args']
 
-  if args.filter:
+  if args.filter and not args.rerun_failures:
     for i in range(len(args.filter)):
       args.filter[i] = ('' if args.filter[i].startswith('*') else '*') + args.filter[i]
       args.filter[i] += ('' if args.filter[i].endswith('*') else '*')
@@ -98,7 +179,140 @@ def parse_arguments():
   return args, extra_args
 
 
-def execute_shard(args, cmd):
+def balance_tests(durations, shard):
+  # Assign the longest test to the shard that has the least total duration.
+  shard_loads = [(0, i) for i in range(shard)]
+  shard_tests = [[] for _ in range(shard)]
+  for name, duration in sorted(durations.items(), key=lambda x: (-x[1], x[0])):
+    load, i = heapq.heappop(shard_loads)
+    shard_tests[i].append(name)
+    heapq.heappush(shard_loads, (load + duration, i))
+  return shard_tests, [load for load, _ in sorted(shard_loads, key=lambda x: x[1])]
+
+
+def split_gtest_filter(cmd):
+  # Return the command without --gtest_filter, and the positive and negative
+  # patterns of the filter.
+  index = index_match(cmd, lambda x: x.startswith('--gtest_filter='))
+  if index < 0:
+    return cmd, [], []
+  positive, _, negative = cmd[index].split('=', 1)[1].partition('-')
+  return (cmd[:index] + cmd[index+1:], [x for x in positive.split(':') if x],
+          [x for x in negative.split(':') if x])
+
+
+def create_balanced_shards(args, cmd):
+  # Return args.shard commands with the balanced tests and one more command that
+  # runs the tests without duration.
+  durations = parse_result.load_duration_db().get(args.test_name)
+  # The --gtest_filter is moved into the filter files, so the tests it excludes
+  # are not balanced or run by any shard.
+  cmd, positive, negative = split_gtest_filter(cmd)
+  if durations:
+    durations = {name: duration for name, duration in durations.items()
+                 if (not positive or any(fnmatch.fnmatchcase(name, x) for x in positive))
+                 and not any(fnmatch.fnmatchcase(name, x) for x in negative)}
+  if not durations:
+    print('\nNo test duration of %s, the shards are split by the test launcher' % args.test_name)
+    return None
+  # An empty filter file runs all tests, so every shard needs a test.
+  if len(durations) < args.shard:
+    print('\nFewer tests than shards in the test duration of %s, '
+          'the shards are split by the test launcher' % args.test_name)
+    return None
+
+  filter_files = [path.abspath('%s.shard%02d.filter' % (args.test_name, i))
+                  for i in range(args.shard + 1)]
+  shard_cmds = [cmd + [FILTER_FILE_FLAG + x] for x in filter_files]
+  # The completed shards of an interrupted run are skipped only with the same
+  # filters, see get_manifest_command(), so keep them even if the durations changed.
+  if args.resume and all(path.exists(x) for x in filter_files):
+    print('\nResume with the test filters of the interrupted run')
+    return shard_cmds
+
+  shard_tests, shard_loads = balance_tests(durations, args.shard)
+  shard_tests.append(positive + ['-' + x for x in sorted(durations)])
+  if not args.dry_run:
+    for i, tests in enumerate(shard_tests):
+      write_line(filter_files[i], tests + ['-' + x for x in negative])
+
+  print('\nExpected shard time:')
+  for i, load in enumerate(shard_loads):
+    print('shard%02d    %d min %02d s' % (i, load // 60, load % 60))
+  print('shard%02d    the tests without duration' % len(shard_loads))
+  return shard_cmds
+
+
+def find_failure_filter(result_dir, module, test_name):
+  # The filters match the failures exactly. The names of telemetry tests are
+  # joined by '/' in the result but by '.' in the test id, '?' matches both.
+  summary = parse_result.generate_summary(
+      parse_result.parse_arguments(['--dir', result_dir, '--type', module]))
+  filters = []
+  for record in summary['new_fail'] if summary else []:
+    if record['suite'].split('.')[0] != test_name:
+      continue
+    name = record['name'].replace('/', '?') if module == 'content' else record['name']
+    if not name in filters:
+      filters.append(name)
+  return filters
+
+
+def report_reproduction(args):
+  log_name = path.splitext(args.log_file)[0]
+  result_ext = '.json' if args.module in ['content', 'blink'] else '.log'
+  fail_count, run_count, run_total = defaultdict(int), defaultdict(int), 0
+  for file_name in sorted(os.listdir('.')):
+    if (not file_name.startswith(log_name + '.') or
+        not file_name.endswith((result_ext, result_ext + COMPRESSED_EXT))):
+      continue
+    test_suite = parse_test_result_file(args.module, path.abspath(file_name), PARSE_CACHE_DIR)
+    run_total += 1
+    for name in test_suite.GetNameIndex():
+      run_count[name] += 1
+    for test_result in test_suite.unexpected_fail:
+      fail_count[test_result.name] += 1
+
+  print('\nReproduction Rate (%d runs):' % run_total)
+  names = sorted(run_count.keys(), key=lambda x: (-fail_count[x] / run_count[x], x))
+  name_format = '{:<%d}' % (max([len(x) for x in names] + [0]) + 2)
+  for name in names:
+    print('%s%d/%d  %d%%' % (name_format.format(name), fail_count[name], run_count[name],
+                            fail_count[name] * 100 // run_count[name]))
+
+
+def get_manifest_command(cmd):
+  # The contents of the filter files are hashed into the command, so that a run is
+  # not skipped on resume if its tests have changed.
+  manifest_cmd = []
+  for arg in cmd:
+    manifest_cmd.append(arg)
+    if arg.startswith(FILTER_FILE_FLAG) and path.exists(arg[len(FILTER_FILE_FLAG):]):
+      with open(arg[len(FILTER_FILE_FLAG):], 'rb') as f:
+        manifest_cmd.append('#' + hashlib.md5(f.read()).hexdigest())
+  return ' '.join(manifest_cmd)
+
+
+def is_result_file_valid(result_file):
+  # The result file is valid if it's complete JSON with a "tests" map.
+  depth, key, has_tests = 0, None, False
+  try:
+    for event, value in read_json_event(result_file, decode_depth=2):
+      if event == 'map_key' and depth == 1:
+        key = value
+      elif event == 'start_map':
+        has_tests = has_tests or (depth == 1 and key == 'tests')
+        depth += 1
+      elif event == 'end_map':
+        depth -= 1
+      elif event == 'value' and depth == 1 and key == 'tests':
+        has_tests = isinstance(value, dict)
+  except (OSError, ValueError):
+    return False
+  return has_tests
+
+
+def execute_shard(args, cmd, index=None, output=None):
   env = get_env()
   if is_win():
     for var in ['http_proxy', 'https_proxy', 'HTTP_PROXY', 'HTTPS_PROXY']:
@@ -108,11 +322,15 @@ def execute_shard(args, cmd):
 
   log_name, log_ext = path.splitext(args.log_file)
   result_name, result_ext = path.splitext(args.result_file)
-  shard_ext = '.shard' + format(args.index, '02d') if args.shard > 1 else ''
+  shard_ext = '.shard' + format(index, '02d') if args.shard > 1 else ''
 
+  start_time = get_currenttime()
   for n in range(args.repeat):
     repeat_ext = '.' + format(n, '03d') if args.repeat > 1 else ''
     log_file = log_name + shard_ext + repeat_ext + log_ext
+    timeout_file = log_name + shard_ext + repeat_ext + TIMEOUT_EXT
+    resource_file = log_name + shard_ext + repeat_ext + RESOURCE_EXT
+    log_file += COMPRESSED_EXT if args.compress_log else ''
     if args.module in ['content', 'blink']:
       result_file = result_name + shard_ext + repeat_ext + result_ext
       result_arg = ['--write-full-results-to=' + result_file]
@@ -120,19 +338,174 @@ def execute_shard(args, cmd):
       result_arg = []
 
     if args.dry_run:
-      print('\n' + ' '.join(cmd + result_arg))
+      print('\n' + ' '.join(cmd + result_arg), file=output)
       continue
+
+    run_name = log_name + shard_ext + repeat_ext
+    run_command = get_manifest_command(cmd + result_arg)
+    if args.resume and args.manifest.IsComplete(run_name, run_command):
+      print('\n%s has been completed, skipped' % run_name, file=output)
+      continue
+    args.manifest.Remove(run_name)
+
+    completed = True
+    live_parser = None
+    if args.live_parse and not result_arg and args.module in ['gpu', 'angle', 'dawn']:
+      live_parser = LiveResultParser(args.module, log_file, args.print_log or output)
+    end_matcher = None if result_arg else LOG_END_MATCHER.get(args.module)
+    log_ended = False
+
+    def handle_line(line):
+      nonlocal log_ended
+      if live_parser:
+        live_parser.ParseLine(line)
+      if end_matcher and not log_ended:
+        log_ended = any(end_matcher.match(x.strip()) for x in line.split('\r'))
+
+    remove(timeout_file)
+    # A result left by an earlier attempt would hide a crash of this one.
+    if result_arg:
+      remove(result_file)
+      remove(result_file + COMPRESSED_EXT)
     try:
-      execute_log(cmd + result_arg, log_file, print_log=args.print_log, env=env)
+      with trace_span(run_name, 'test', command=' '.join(cmd + result_arg)):
+        execute_log(cmd + result_arg, log_file, print_log=args.print_log, env=env, output=output,
+                    sync_interval=args.log_sync_interval,
+                    line_handler=handle_line if live_parser or end_matcher else None,
+                    timeout=args.timeout, inactivity_timeout=args.inactivity_timeout,
+                    resource_path=resource_file, sample_interval=args.sample_interval)
     except CalledProcessError:
       pass
+    except ProcessTimeoutError as e:
+      completed = False
+      print('\n[WATCHDOG] %s, the process tree is killed' % e, file=output)
+      write_file(timeout_file, json.dumps({
+        'name':      path.splitext(timeout_file)[0],
+        'reason':    e.reason,
+        'timeout':   e.timeout,
+        'elapsed':   round(e.elapsed, 1),
+        'last_line': e.last_line,
+      }))
+    if args.compress_log and result_arg and path.exists(result_file):
+      compress_file(result_file)
+      result_file += COMPRESSED_EXT
+    # The test crashed if it didn't write a valid result file or the end of the log.
+    if completed and end_matcher and not log_ended:
+      completed = False
+      print('\n%s crashed before the end of the log, it\'s run again on resume' % run_name,
+            file=output)
+    if completed and result_arg and not is_result_file_valid(result_file):
+      completed = False
+      print('\n%s crashed without a valid result file, it\'s run again on resume' % run_name,
+            file=output)
+    if completed:
+      args.manifest.SetComplete(run_name, run_command,
+                                [log_file, result_file] if result_arg else [log_file])
+
+    # Only the completed runs are parsed and cached here, the others are parsed later
+    # as usual if they have anything to parse.
+    test_suite = live_parser.Finish() if live_parser else None
+    if not completed or not args.live_parse:
+      continue
+    try:
+      if live_parser:
+        save_parse_cache(args.module, path.abspath(log_file), test_suite, PARSE_CACHE_DIR)
+      else:
+        test_suite = parse_test_result_file(args.module, path.abspath(result_file),
+                                            PARSE_CACHE_DIR)
+    except (OSError, ValueError) as e:
+      print('\nFailed to parse %s: %s' % (run_name, e), file=output)
+      continue
+    print('%s    [Pass:%d] [Fail:%d] [Skip:%d]' %
+          (test_suite.name, len(test_suite.actual_pass), len(test_suite.actual_fail),
+           len(test_suite.skip)), file=output)
+  return (get_currenttime() - start_time).total_seconds()
+
+
+class LiveResultParser(object):
+  # Feed the test output to the parser of parse_result, the lines are split
+  # the same way as reading them back from the log file.
+  def __init__(self, module, log_file, quiet):
+    self.parser = create_log_result_parser(module, get_result_name(log_file))
+    self.quiet = quiet
+    self.last_status = time.monotonic()
+
+  def ParseLine(self, line):
+    self.parser.ParseLines(x.rstrip() for x in line.split('\r'))
+    if not self.quiet and time.monotonic() - self.last_status >= LIVE_STATUS_INTERVAL:
+      self.last_status = time.monotonic()
+      test_suite = self.parser.test_suite
+      print('\r[Pass:%d] [Fail:%d] [Skip:%d]' %
+            (len(test_suite.actual_pass), len(test_suite.actual_fail), len(test_suite.skip)),
+            end='', flush=True)
+
+  def Finish(self):
+    # The final counters are printed over the live status line.
+    if not self.quiet:
+      print('\r', end='')
+    return self.parser.test_suite
+
+
+class RunManifest(object):
+  # Record the runs that have completed with the command and the size of their
+  # files. A run is only skipped if it had the same command and its files are
+  # unchanged. The shards running concurrently share the manifest.
+  def __init__(self, manifest_file):
+    self.manifest_file = manifest_file
+    self.lock = threading.Lock()
+    try:
+      self.runs = read_json(manifest_file)['runs']
+    except (OSError, ValueError, KeyError):
+      self.runs = {}
+
+  def IsComplete(self, name, command):
+    run = self.runs.get(name)
+    if not run or run['command'] != command:
+      return False
+    return all(path.isfile(x) and path.getsize(x) == size for x, size in run['files'])
+
+  def SetComplete(self, name, command, files):
+    with self.lock:
+      self.runs[name] = {'command': command, 'files': [[x, path.getsize(x)] for x in files]}
+      self.Save()
+
+  def Remove(self, name):
+    with self.lock:
+      if self.runs.pop(name, None):
+        self.Save()
+
+  def Save(self):
+    write_file_atomic(self.manifest_file, json.dumps({'runs': self.runs}, indent=2, sort_keys=True))
+
+
+def execute_parallel_shards(args, shard_cmds):
+  print_lock = threading.Lock()
+
+  # Buffer the output of each shard so that the shards don't interleave.
+  def execute_buffered_shard(index):
+    output = io.StringIO()
+    shard_time = execute_shard(args, shard_cmds[index], index, output)
+    with print_lock:
+      print(output.getvalue(), end='', flush=True)
+    return shard_time
+
+  with ThreadPoolExecutor(min(args.parallel_shards, len(shard_cmds))) as executor:
+    try:
+      return list(executor.map(execute_buffered_shard, range(len(shard_cmds))))
+    except KeyboardInterrupt:
+      # Only this thread gets Ctrl-C, kill the shards so that their threads finish.
+      print('\nInterrupted, killing the running shards', flush=True)
+      kill_live_processes()
+      executor.shutdown(cancel_futures=True)
+      reset_live_processes()
+      raise
 
 
-def main():
+def main(argv=None):
   def get_executable(file_path):
     return file_path + ('.exe' if sys.platform == 'win32' else '')
 
-  args, extra_args = parse_arguments()
+  args, extra_args = parse_arguments(argv)
 
   # Generate command
   if args.module == 'content':
@@ -177,6 +550,12 @@ def main():
   if args.filter:
     if args.module == 'content':
       test_args += ['--test-filter=' + '::'.join(args.filter)]
+    elif args.module == 'blink':
+      index = index_match(test_args, lambda x: x.startswith('--isolated-script-test-filter='))
+      if index < 0:
+        test_args += ['--isolated-script-test-filter=' + '::'.join(args.filter)]
+      else:
+        test_args[index] = '--isolated-script-test-filter=' + '::'.join(args.filter)
     elif args.module in ['gpu', 'angle', 'dawn']:
       index = index_match(test_args, lambda x: x.startswith('--gtest_filter='))
       if index < 0:
@@ -193,22 +572,39 @@ def main():
     assert not browser_args
 
   cmd += test_args + extra_args
+  args.manifest = None if args.dry_run else RunManifest(RUN_MANIFEST_FILE)
   if args.shard == 1:
     execute_shard(args, cmd)
   else:
-    if args.module in ['content', 'blink']:
-      cmd += ['--total-shards=%d' % args.shard]
-      shard_index_flag = '--shard-index'
-    elif args.module in ['gpu', 'angle', 'dawn']:
-      cmd += ['--test-launcher-total-shards=%d' % args.shard]
-      shard_index_flag = '--test-launcher-shard-index'
+    shard_cmds = None
+    if args.balance_shards and args.module in ['gpu', 'angle', 'dawn']:
+      shard_cmds = create_balanced_shards(args, cmd)
+    if not shard_cmds:
+      if args.module in ['content', 'blink']:
+        cmd += ['--total-shards=%d' % args.shard]
+        shard_index_flag = '--shard-index'
+      elif args.module in ['gpu', 'angle', 'dawn']:
+        cmd += ['--test-launcher-total-shards=%d' % args.shard]
+        shard_index_flag = '--test-launcher-shard-index'
+      shard_cmds = [cmd + ['%s=%d' % (shard_index_flag, i)] for i in range(args.shard)]
 
     if args.index is None:
-      for i in range(args.shard):
-        args.index = i
-        execute_shard(args, cmd + ['%s=%d' % (shard_index_flag, args.index)])
+      if args.parallel_shards > 1:
+        shard_times = execute_parallel_shards(args, shard_cmds)
+      else:
+        shard_times = [execute_shard(args, shard_cmds[i], i) for i in range(len(shard_cmds))]
+
+      print('\nShard time:')
+      for i in range(len(shard_cmds)):
+        print('shard%02d    %d min %02d s' % (i, shard_times[i] // 60, shard_times[i] % 60))
     else:
-      execute_shard(args, cmd + ['%s=%d' % (shard_index_flag, args.index)])
+      execute_shard(args, shard_cmds[args.index], args.index)
+      # The last index also runs the tests without duration of the balanced shards.
+      if len(shard_cmds) > args.shard and args.index == args.shard - 1:
+        execute_shard(args, shard_cmds[args.shard], args.shard)
+
+  if args.rerun_failures and not args.dry_run:
+    report_reproduction(args)
 
 
 if __name__ == '__main__':
@@ -1,23 +1,22 @@
 #!/usr/bin/env python3
 
 import argparse
+import traceback
+
+import build_project
+import parse_result
+import run_gpu_test
 
 from util.base_util import *
 from util.file_util import *
 
 TRYJOB_DIR = path.join(REPOSITORY_DIR, 'tryjob')
-BUILD_PROJECT = path.join(REPOSITORY_DIR, 'bin', 'build_project')
-RUN_GPU_TEST  = path.join(REPOSITORY_DIR, 'bin', 'run_gpu_test')
-PARSE_RESULT  = path.join(REPOSITORY_DIR, 'bin', 'parse_result')
 
 TRYJOB_REPORT   = 'tryjob_report.txt'
 AQUARIUM_REPORT = 'aquarium_report.txt'
+TRYJOB_TRACE    = 'tryjob_trace.json'
 
-PATTERN_AQUARIUM_TEST = r'^aquarium_(\w+)_tests\s+(\d+)$'
-
-PATTERN_FLAKY_PASS = r'^.*\[Flaky Pass:(\d+)\].*$'
-PATTERN_NEW_PASS   = r'^.*\[New Pass:(\d+)\].*$'
-PATTERN_NEW_FAIL   = r'^.*\[New Fail:(\d+)\].*$'
+PATTERN_AQUARIUM_TEST = r'^aquarium_(\w+)_tests$'
 
 def parse_arguments():
   config = load_tryjob_config()
@@ -48,10 +47,18 @@ def parse_arguments():
   parser.add_argument('--target', '-t', default='Default',
       help='The target build directory under "out/". Default is "Default".\n\n')
   parser.add_argument('--build', '-b', action='store_true',
-      help='Rebuild all targets before running tests.\n\n')
+      help='Rebuild all targets before running tests.\n'\
+           'A project is skipped if its source revision and build arguments are the same as its last successful build.\n\n')
   parser.add_argument('--update', '-u', action='store_true',
       help='Fetch from origin and rebase to master, then synchronize the dependencies before building.\n'\
            '--build will be enabled automatically.\n\n')
+  parser.add_argument('--compress-log', '-z', action='store_true',
+      help='Compress the test logs and results with gzip.\n\n')
+  parser.add_argument('--balance-shards', action='store_true',
+      help='Balance the shards of gpu, angle and dawn tests by the test durations of the past tryjobs.\n'\
+           'See run_gpu_test --balance-shards.\n\n')
+  parser.add_argument('--resume', action='store_true',
+      help='Resume the interrupted tryjob in --result-dir, the completed shards are not run again.\n\n')
   parser.add_argument('--email', '-e', action='store_true',
       help='Send the report by email.\n\n')
   parser.add_argument('--dry-run', nargs='?', const=get_platform(), choices=['win', 'linux'],
@@ -80,6 +87,8 @@ def parse_arguments():
 
   if not args.test_types:
     raise Exception('No available test for specified condition')
+  if args.resume and not args.result_dir:
+    raise Exception('Please specify --result-dir to resume')
   if 'aquarium' in test_modules and not args.aquarium_dir:
     raise Exception('Please specify --aquarium-dir')
   if 'angle' in test_modules and not args.chrome_dir and not args.angle_dir:
@@ -110,59 +119,63 @@ def parse_arguments():
   return args
 
 
-def update_tryjob_report(report):
+def load_report_summary(argv):
+  with trace_span('parse_result', argv=' '.join(argv)):
+    return parse_result.generate_summary(parse_result.parse_arguments(argv))
+
+
+def update_tryjob_report(summary):
   new_fail, new_pass, flaky_pass = 0, 0, 0
-  for line in report.splitlines():
-    match = re_match(PATTERN_NEW_FAIL, line)
-    new_fail += int(match.group(1)) if match else 0
-    if not line.startswith('webgpu'):
-      match = re_match(PATTERN_NEW_PASS, line)
-      new_pass += int(match.group(1)) if match else 0
-    match = re_match(PATTERN_FLAKY_PASS, line)
-    flaky_pass += int(match.group(1)) if match else 0
+  for suite in summary['suites']:
+    new_fail += suite['new_fail']
+    if not suite['name'].startswith('webgpu'):
+      new_pass += suite['new_pass']
+    flaky_pass += suite['flaky_pass']
 
   notice  = ' [New Fail:%d]' % new_fail if new_fail else ''
   notice += ' [New Pass:%d]' % new_pass if new_pass else ''
   notice += ' [Flaky Pass:%d]' % flaky_pass if flaky_pass else ''
+  notice += ' [Timed Out:%d]' % len(summary['timeout']) if summary['timeout'] else ''
   notice = notice or ' [All Clear]'
   title = 'Tryjob Report - %s / %s -%s' % (get_platform().title(), get_hostname(), notice)
-  return title, report
+  return title, parse_result.render_test_report(summary).rstrip()
 
 
-def update_aquarium_report(report, average_fps):
+def update_aquarium_report(summary, average_fps):
   max_bias = 0
-  lines = report.splitlines()
-  for i in range(len(lines)):
-    match = re_match(PATTERN_AQUARIUM_TEST, lines[i])
+  for record in summary['average_fps']:
+    match = re_match(PATTERN_AQUARIUM_TEST, record['name'])
     if match:
       ref_value = average_fps[match.group(1)]
-      bias = (int(match.group(2)) - ref_value) * 100 // ref_value
-      lines[i] += ' (%s%d%%)' % ('+' if bias >= 0 else '', bias)
+      bias = (record['average_fps'] - ref_value) * 100 // ref_value
+      record['bias'] = bias
       max_bias = bias if abs(bias) > abs(max_bias) else max_bias
 
   notice = '[Max Bias:%s%d%%]' % ('+' if max_bias >= 0 else '', max_bias) if max_bias else '[No Bias]'
   title = 'Aquarium Report - %s / %s - %s' % (get_platform().title(), get_hostname(), notice)
-  return title, '\n'.join(lines)
+  return title, parse_result.render_perf_report(summary).rstrip()
 
 
-def main():
-  args = parse_arguments()
-
+def run_tryjob(args):
   # Build project
   if args.build or args.update:
     for project in ['chrome', 'angle', 'dawn', 'aquarium']:
       src_dir = getattr(args, project + '_dir')
       if not src_dir:
         continue
+      build_argv = [project, '--dir', src_dir, '--target', args.target]
+      build_argv += ['--update'] if args.update else []
       try:
-        cmd = [BUILD_PROJECT, project, '--dir', src_dir, '--target', args.target]
-        cmd += ['--update'] if args.update else []
-        execute(cmd)
-      except CalledProcessError as e:
+        # Keep the output for the email if the build fails.
+        with trace_span('build_project ' + project), capture_output() as build_output:
+          build_project.main(build_argv)
+      except Exception as e:
         if args.email:
-          send_email(args.receiver_aquarium if project == 'aquarium' else args.receiver_admin,
-                     'build_project %s failed on %s' % (project, get_hostname()),
-                     ' '.join(cmd) + '\n\n' + execute_return(cmd))
+          with trace_span('send_email', subject='build_project %s failed' % project):
+            send_email(args.receiver_aquarium if project == 'aquarium' else args.receiver_admin,
+                       'build_project %s failed on %s' % (project, get_hostname()),
+                       'build_project ' + ' '.join(build_argv) + '\n\n' +
+                       build_output.getvalue() + '\n' + traceback.format_exc())
         if project == 'aquarium':
           args.aquarium_dir = None
         else:
@@ -171,39 +184,55 @@ def main():
   # Run tests
   print('\nTest log: ' + args.result_dir)
   mkdir(args.result_dir)
-  for module, backend in args.test_types:
-    if module == 'aquarium' and not args.aquarium_dir:
-      continue
-    cmd = [RUN_GPU_TEST, module, backend, '--target', args.target]
-    cmd += ['--dir', getattr(args, module + '_dir', None) or args.chrome_dir]
-    cmd += ['--dry-run', args.dry_run] if args.dry_run else []
-    execute(cmd, dir=args.result_dir)
+  # The tests write their logs and results to the current directory.
+  current_dir = os.getcwd()
+  os.chdir(args.result_dir)
+  try:
+    for module, backend in args.test_types:
+      if module == 'aquarium' and not args.aquarium_dir:
+        continue
+      test_argv = [module, backend, '--target', args.target]
+      test_argv += ['--dir', getattr(args, module + '_dir', None) or args.chrome_dir]
+      test_argv += ['--live-parse']
+      test_argv += ['--balance-shards'] if args.balance_shards else []
+      test_argv += ['--compress-log'] if args.compress_log else []
+      test_argv += ['--resume'] if args.resume else []
+      test_argv += ['--dry-run', args.dry_run] if args.dry_run else []
+      with trace_span('run_gpu_test %s %s' % (module, backend)):
+        run_gpu_test.main(test_argv)
+  finally:
+    os.chdir(current_dir)
 
   # Parse result
-  gpu_info = get_gpu_info()
+  with trace_span('get_gpu_info'):
+    gpu_info = get_gpu_info()
   header  = 'Location: %s\n' % args.result_dir
   header += 'GPU: %s\n' % gpu_info.device
   header += 'Driver: %s\n' % gpu_info.driver_version
 
-  aquarium_report = execute_return([PARSE_RESULT, '--type', 'aquarium', '--dir', args.result_dir])
-  if aquarium_report:
-    title, aquarium_report = update_aquarium_report(aquarium_report, args.average_fps)
+  aquarium_summary = load_report_summary(['--type', 'aquarium', '--dir', args.result_dir])
+  if aquarium_summary:
+    title, aquarium_report = update_aquarium_report(aquarium_summary, args.average_fps)
     aquarium_report = '%s\n\n%s\n%s' % (title, header, aquarium_report)
     write_file(path.join(args.result_dir, AQUARIUM_REPORT), aquarium_report)
     if args.email:
-      send_email(args.receiver_report, title, aquarium_report)
+      with trace_span('send_email', subject=title):
+        send_email(args.receiver_report, title, aquarium_report)
     print('\n--------------------------------------------------\n' + aquarium_report)
 
-  tryjob_report = execute_return([PARSE_RESULT, '--dir', args.result_dir])
-  if tryjob_report:
+  # The durations of this run balance the shards of the next run.
+  tryjob_summary = load_report_summary(['--dir', args.result_dir] +
+                                       ([] if args.dry_run else ['--update-durations']))
+  if tryjob_summary:
     if args.chrome_dir:
       revision = get_chrome_revision(args.chrome_dir)
       header += 'Chrome: %s\n' % revision if revision else ''
-    title, tryjob_report = update_tryjob_report(tryjob_report)
+    title, tryjob_report = update_tryjob_report(tryjob_summary)
     tryjob_report = '%s\n\n%s\n%s' % (title, header, tryjob_report)
     write_file(path.join(args.result_dir, TRYJOB_REPORT), tryjob_report)
     if args.email:
-      send_email(args.receiver_report, title, tryjob_report)
+      with trace_span('send_email', subject=title):
+        send_email(args.receiver_report, title, tryjob_report)
     print('\n--------------------------------------------------\n' + tryjob_report)
 
   print('\n--------------------------------------------------\n')
@@ -214,5 +243,19 @@ def main():
     print('Tryjob report   : ' + path.join(args.result_dir, TRYJOB_REPORT))
 
 
+def main():
+  args = parse_arguments()
+  start_trace()
+  try:
+    with trace_span('run_tryjob'):
+      run_tryjob(args)
+  finally:
+    # Keep the trace of a failed run as well, it shows where the run stopped.
+    if not args.dry_run:
+      mkdir(args.result_dir)
+      save_trace(path.join(args.result_dir, TRYJOB_TRACE))
+      print('Tryjob trace    : ' + path.join(args.result_dir, TRYJOB_TRACE))
+
+
 if __name__ == '__main__':
   sys.exit(main())
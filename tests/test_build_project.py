@@ -0,0 +1,55 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import build_project
+
+
+class BuildStampTest(unittest.TestCase):
+  def setUp(self):
+    self.temp_dir = tempfile.TemporaryDirectory()
+
+  def tearDown(self):
+    self.temp_dir.cleanup()
+
+  def createRepo(self, repo_dir):
+    os.makedirs(repo_dir)
+    self.writeFile(os.path.join(repo_dir, 'BUILD.gn'), '')
+    for command in [['init', '-q'], ['add', '-A'],
+                    ['-c', 'user.name=test', '-c', 'user.email=test@test', 'commit', '-qm', 'init']]:
+      subprocess.run(['git'] + command, cwd=repo_dir, check=True)
+
+  def writeFile(self, file_path, content):
+    with open(file_path, 'w') as f:
+      f.write(content)
+
+  def checkSubRepoEdit(self, src_dir, gclient_root, entry_prefix):
+    self.createRepo(src_dir)
+    self.writeFile(os.path.join(src_dir, '.gitignore'), 'third_party/\n.gclient_entries\n')
+    sub_dir = os.path.join(src_dir, 'third_party', 'dawn')
+    self.createRepo(sub_dir)
+    self.writeFile(os.path.join(gclient_root, '.gclient_entries'),
+                   "entries = {\n  '%sthird_party/dawn': 'https://dawn.googlesource.com/dawn',\n}\n"
+                   % entry_prefix)
+    self.assertEqual(build_project.find_sub_repos(src_dir), [os.path.join('third_party', 'dawn')])
+
+    stamp = build_project.get_build_stamp(src_dir, ['dawn'], '')
+    self.assertEqual(stamp, build_project.get_build_stamp(src_dir, ['dawn'], ''))
+    self.writeFile(os.path.join(sub_dir, 'BUILD.gn'), 'group("dawn") {}\n')
+    self.assertNotEqual(stamp, build_project.get_build_stamp(src_dir, ['dawn'], ''))
+
+  def testGclientEntriesInParent(self):
+    src_dir = os.path.join(self.temp_dir.name, 'src')
+    self.checkSubRepoEdit(src_dir, self.temp_dir.name, 'src/')
+
+  def testGclientEntriesInSourceDir(self):
+    src_dir = os.path.join(self.temp_dir.name, 'dawn')
+    self.checkSubRepoEdit(src_dir, src_dir, '')
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,99 @@
+import os
+import sys
+import tempfile
+import unittest
+import zipfile
+
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from util import file_util
+
+
+class ZipFilesTest(unittest.TestCase):
+  def setUp(self):
+    self.temp_dir = tempfile.TemporaryDirectory()
+    self.src_dir = os.path.join(self.temp_dir.name, 'src')
+    self.zip_file = os.path.join(self.temp_dir.name, 'test.zip')
+    self.contents = {
+      'empty.txt': b'',
+      'text.txt': b'hello world\n' * 1000,
+      'random.bin': os.urandom(100000),
+      'image.png': b'\x89PNG' + b'\0' * 1000,
+      os.path.join('sub', 'dir', 'lib.so'): bytes(range(256)) * 4000,
+    }
+    for name, data in self.contents.items():
+      os.makedirs(os.path.dirname(os.path.join(self.src_dir, name)), exist_ok=True)
+      with open(os.path.join(self.src_dir, name), 'wb') as f:
+        f.write(data)
+
+  def tearDown(self):
+    self.temp_dir.cleanup()
+
+  def checkZip(self, zip_infos):
+    self.assertEqual(sorted(x.filename for x in zip_infos),
+                     sorted(x.replace(os.sep, '/') for x in self.contents))
+    with zipfile.ZipFile(self.zip_file) as zip_file:
+      self.assertIsNone(zip_file.testzip())
+      for name, data in self.contents.items():
+        zip_info = zip_file.getinfo(name.replace(os.sep, '/'))
+        self.assertEqual(zip_file.read(zip_info), data, name)
+        self.assertEqual(zip_info.external_attr,
+                         zipfile.ZipInfo.from_file(os.path.join(self.src_dir, name)).external_attr)
+      return {x.filename: x.compress_type for x in zip_file.infolist()}
+
+  def testParallel(self):
+    compress_types = self.checkZip(file_util.zip(self.zip_file, self.src_dir, ['.png'], 4))
+    self.assertEqual(compress_types['text.txt'], zipfile.ZIP_DEFLATED)
+    self.assertEqual(compress_types['image.png'], zipfile.ZIP_STORED)
+    # Deflating doesn't make random data smaller.
+    self.assertEqual(compress_types['random.bin'], zipfile.ZIP_STORED)
+
+  def testLargeFiles(self):
+    # The files above ZIP_PARALLEL_SIZE are streamed between the parallel ones.
+    with mock.patch.object(file_util, 'ZIP_PARALLEL_SIZE', 50000):
+      compress_types = self.checkZip(file_util.zip(self.zip_file, self.src_dir, ['.png'], 2))
+    self.assertEqual(compress_types['sub/dir/lib.so'], zipfile.ZIP_DEFLATED)
+    self.assertEqual(compress_types['image.png'], zipfile.ZIP_STORED)
+
+  def testManyFiles(self):
+    # More files than the pending limit of the compressed data.
+    for i in range(50):
+      name = 'file%02d.txt' % i
+      self.contents[name] = (b'%d\n' % i) * i
+      with open(os.path.join(self.src_dir, name), 'wb') as f:
+        f.write(self.contents[name])
+    self.checkZip(file_util.zip(self.zip_file, self.src_dir, [], 2))
+
+
+class WriteFileAtomicTest(unittest.TestCase):
+  def setUp(self):
+    self.temp_dir = tempfile.TemporaryDirectory()
+    self.file_path = os.path.join(self.temp_dir.name, 'test.json')
+
+  def tearDown(self):
+    self.temp_dir.cleanup()
+
+  def testWrite(self):
+    file_util.write_file_atomic(self.file_path, 'text')
+    file_util.write_file_atomic(self.file_path, 'new text')
+    with open(self.file_path) as f:
+      self.assertEqual(f.read(), 'new text')
+    file_util.write_file_atomic(self.file_path, b'\0binary')
+    with open(self.file_path, 'rb') as f:
+      self.assertEqual(f.read(), b'\0binary')
+    self.assertEqual(os.listdir(self.temp_dir.name), ['test.json'])
+
+  def testFailedWrite(self):
+    # The file is unchanged and no temporary file is left.
+    file_util.write_file_atomic(self.file_path, 'text')
+    with self.assertRaises(TypeError):
+      file_util.write_file_atomic(self.file_path, None)
+    with open(self.file_path) as f:
+      self.assertEqual(f.read(), 'text')
+    self.assertEqual(os.listdir(self.temp_dir.name), ['test.json'])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,38 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import parse_result
+
+
+class LogEndMatcherTest(unittest.TestCase):
+  def testGtestEnd(self):
+    matcher = parse_result.LOG_END_MATCHER['dawn']
+    for line in ['[==========] 2 tests from 1 test suite ran. (6 ms total)',
+                 '[==========] 1 test from 1 test suite ran. (1 ms total)',
+                 '[==========] 1 test from 2 test suites ran. (1 ms total)',
+                 '[==========] 12 tests from 3 test suites ran. (10 ms total)']:
+      self.assertTrue(matcher.match(line), line)
+    self.assertFalse(matcher.match('[==========] Running 2 tests from 1 test suite.'))
+
+  def testUnittestEnd(self):
+    matcher = parse_result.LOG_END_MATCHER['angle']
+    self.assertTrue(matcher.match('Tests took 1 second.'))
+    self.assertTrue(matcher.match('Tests took 25 seconds.'))
+    self.assertFalse(matcher.match('Tests took'))
+
+  def testGtestParserStopsAtSingularEnd(self):
+    parser = parse_result.GtestResultParser('dawn_end2end_tests')
+    parser.ParseLines([
+      '[ RUN      ] Suite.Test/Vulkan',
+      '[  FAILED  ] Suite.Test/Vulkan, where GetParam() = Vulkan (5 ms)',
+      '[==========] 1 test from 1 test suite ran. (6 ms total)',
+      '[  FAILED  ] Suite.Test/Vulkan, where GetParam() = Vulkan (5 ms)',
+    ])
+    self.assertEqual(len(parser.test_suite.names), 1)
+
+
+if __name__ == '__main__':
+  unittest.main()
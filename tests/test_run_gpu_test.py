@@ -0,0 +1,87 @@
+import argparse
+import os
+import sys
+import tempfile
+import unittest
+
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import run_gpu_test
+
+
+class ResultFileTest(unittest.TestCase):
+  def setUp(self):
+    self.temp_dir = tempfile.TemporaryDirectory()
+    self.result_file = os.path.join(self.temp_dir.name, 'result.json')
+
+  def tearDown(self):
+    self.temp_dir.cleanup()
+
+  def checkResult(self, content):
+    with open(self.result_file, 'w') as f:
+      f.write(content)
+    return run_gpu_test.is_result_file_valid(self.result_file)
+
+  def testValid(self):
+    self.assertTrue(self.checkResult(
+      '{"version": 3, "tests": {"a": {"b": {"actual": "PASS"}}}, "num_failures_by_type": {}}'))
+    self.assertTrue(self.checkResult('{"tests": {}}'))
+
+  def testTruncated(self):
+    self.assertFalse(self.checkResult('{"version": 3, "tests": {"a": {"b": '))
+    self.assertFalse(self.checkResult(''))
+
+  def testMissingTests(self):
+    self.assertFalse(self.checkResult('{"version": 3, "a": {"tests": {}}}'))
+    self.assertFalse(self.checkResult('{"tests": []}'))
+
+  def testMissingFile(self):
+    self.assertFalse(run_gpu_test.is_result_file_valid(self.result_file))
+
+
+class BalancedShardsTest(unittest.TestCase):
+  DURATIONS = {'A.Test/GL': 3, 'A.Test/Vulkan': 2, 'A.Test/Vulkan_SwiftShader': 9, 'B.Test/GL': 1}
+
+  def setUp(self):
+    self.temp_dir = tempfile.TemporaryDirectory()
+    self.current_dir = os.getcwd()
+    os.chdir(self.temp_dir.name)
+
+  def tearDown(self):
+    os.chdir(self.current_dir)
+    self.temp_dir.cleanup()
+
+  def createShards(self, cmd):
+    args = argparse.Namespace(test_name='angle_end2end_tests', shard=2, resume=False, dry_run=None)
+    with mock.patch.object(run_gpu_test.parse_result, 'load_duration_db',
+                           return_value={args.test_name: self.DURATIONS}):
+      shard_cmds = run_gpu_test.create_balanced_shards(args, cmd)
+    filters = []
+    for shard_cmd in shard_cmds:
+      with open(shard_cmd[-1][len(run_gpu_test.FILTER_FILE_FLAG):]) as f:
+        filters.append(f.read().split())
+    return shard_cmds, filters
+
+  def testNegativeFilter(self):
+    shard_cmds, filters = self.createShards(
+        ['angle_end2end_tests', '--use-gpu-in-tests', '--gtest_filter=-*Vulkan_SwiftShader*'])
+    self.assertEqual(len(shard_cmds), 3)
+    for shard_cmd in shard_cmds:
+      self.assertEqual(shard_cmd[:2], ['angle_end2end_tests', '--use-gpu-in-tests'])
+      self.assertFalse(any(x.startswith('--gtest_filter=') for x in shard_cmd))
+    self.assertEqual(filters[0], ['A.Test/GL', '-*Vulkan_SwiftShader*'])
+    self.assertEqual(filters[1], ['A.Test/Vulkan', 'B.Test/GL', '-*Vulkan_SwiftShader*'])
+    self.assertEqual(filters[2], ['-A.Test/GL', '-A.Test/Vulkan', '-B.Test/GL',
+                                  '-*Vulkan_SwiftShader*'])
+
+  def testPositiveFilter(self):
+    _, filters = self.createShards(['angle_end2end_tests', '--gtest_filter=*/GL:*/Vulkan-B.*'])
+    self.assertEqual(filters[0], ['A.Test/GL', '-B.*'])
+    self.assertEqual(filters[1], ['A.Test/Vulkan', '-B.*'])
+    self.assertEqual(filters[2], ['*/GL', '*/Vulkan', '-A.Test/GL', '-A.Test/Vulkan', '-B.*'])
+
+
+if __name__ == '__main__':
+  unittest.main()
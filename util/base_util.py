@@ -1,12 +1,19 @@
 import collections
+import contextlib
 import datetime
+import gzip
+import io
+import json
 import os
 import random
 import re
 import socket
 import string
+import signal
 import subprocess
 import sys
+import threading
+import time
 
 from collections import defaultdict
 from pathlib import Path
@@ -33,8 +40,36 @@ PATTERN_DEVICE = r'^    Device: Mesa (.+) \(.+\)\s+\(0x(\w+)\)$'
 PATTERN_GL_VERSION = r'^OpenGL core profile version string: [\d\.]+ \(Core Profile\) (.+) ([\d\.]+).*$'
 PATTERN_DEVICE_ID = r'^PCI\\VEN_(\w+)&DEV_(\w+)$'
 
+# By default, the test log is synchronized to disk every second or every 1MB.
+LOG_SYNC_INTERVAL = 1.0
+LOG_SYNC_BYTES = 1024 * 1024
+LOG_COMPRESS_LEVEL = 6
+
+# The percent between the progress lines of a named build.
+PROGRESS_STEP = 5
+
+# How often in seconds the watchdog checks the timeouts of a process.
+WATCHDOG_INTERVAL = 1.0
+
+# How often in seconds the resource usage of a process tree is sampled on Linux.
+RESOURCE_SAMPLE_INTERVAL = 1.0
+RESOURCE_COLUMNS = ['time', 'cpu', 'rss', 'read_bytes', 'write_bytes', 'ctx_switches',
+                    'load', 'swap']
+
 MATCHERS = {}
 
+# The spans in Chrome trace event format, it's None until start_trace() is called.
+TRACE_EVENTS = None
+TRACE_START = None
+TRACE_THREADS = {}
+TRACE_LOCK = threading.Lock()
+
+# The processes started by execute_log(). They run in their own process groups and
+# don't get the SIGINT of the terminal, so they are killed by kill_live_processes().
+LIVE_PROCESSES = set()
+LIVE_PROCESSES_LOCK = threading.Lock()
+LIVE_PROCESSES_KILLED = threading.Event()
+
 class GpuInfo(object):
   def __init__(self):
     self.vendor = None
@@ -45,6 +80,252 @@ class GpuInfo(object):
     self.driver_version = None
 
 
+class ProcessTimeoutError(subprocess.TimeoutExpired):
+  # reason is 'wall' if the process ran out of its time budget, 'inactivity' if
+  # it didn't output anything within the inactivity timeout.
+  def __init__(self, cmd, timeout, reason, elapsed, last_line=''):
+    super().__init__(cmd, timeout)
+    self.reason = reason
+    self.elapsed = elapsed
+    self.last_line = last_line
+
+  def __str__(self):
+    if self.reason == 'inactivity':
+      return 'Command \'%s\' had no output for %g seconds' % (' '.join(self.cmd), self.timeout)
+    return 'Command \'%s\' timed out after %g seconds' % (' '.join(self.cmd), self.timeout)
+
+
+class ProcessWatchdog(object):
+  # Kill the process tree if the process runs longer than timeout or has no
+  # output for longer than inactivity_timeout. Touch() is called on each output.
+  def __init__(self, process, timeout=None, inactivity_timeout=None):
+    self.process = process
+    self.timeout = timeout
+    self.inactivity_timeout = inactivity_timeout
+    self.start_time = self.last_output = time.monotonic()
+    self.reason = None
+    self.limit = None
+    self.stop_event = threading.Event()
+    self.thread = None
+    if timeout or inactivity_timeout:
+      self.thread = threading.Thread(target=self.Watch, daemon=True)
+      self.thread.start()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.Stop()
+    # Don't leave the test running if the output loop is interrupted.
+    if exc_type:
+      kill_process_tree(self.process)
+
+  def Touch(self):
+    self.last_output = time.monotonic()
+
+  def Watch(self):
+    while not self.stop_event.wait(WATCHDOG_INTERVAL):
+      now = time.monotonic()
+      if self.timeout and now - self.start_time >= self.timeout:
+        self.reason, self.limit = 'wall', self.timeout
+      elif self.inactivity_timeout and now - self.last_output >= self.inactivity_timeout:
+        self.reason, self.limit = 'inactivity', self.inactivity_timeout
+      else:
+        continue
+      # Kill the tree even if the process has exited, its children may still hold
+      # the output pipe and block the reading forever.
+      kill_process_tree(self.process)
+      return
+
+  def Stop(self):
+    self.stop_event.set()
+    if self.thread:
+      self.thread.join()
+
+  def GetElapsed(self):
+    return time.monotonic() - self.start_time
+
+
+class ResourceSampler(object):
+  # Sample the CPU time, RSS, I/O bytes and context switches of the process tree
+  # from /proc, with the system load and the used swap. The tree is the process
+  # group of the process, see execute_log(). The counters of the exited
+  # processes are kept, so the totals only grow.
+  def __init__(self, process, interval=RESOURCE_SAMPLE_INTERVAL):
+    self.pgid = process.pid
+    self.interval = interval
+    self.clock_ticks = os.sysconf('SC_CLK_TCK')
+    self.page_size = os.sysconf('SC_PAGE_SIZE')
+    self.counters = {}
+    self.samples = []
+    self.start_time = time.monotonic()
+    self.stop_event = threading.Event()
+    self.thread = threading.Thread(target=self.Run, daemon=True)
+    self.thread.start()
+
+  def Run(self):
+    while True:
+      self.Sample()
+      if self.stop_event.wait(self.interval):
+        return
+
+  def ReadProcess(self, pid):
+    with open('/proc/%s/stat' % pid) as f:
+      stat = f.read()
+    # The command name may contain spaces, the fields after it start from the state.
+    fields = stat[stat.rfind(')')+2:].split()
+    if int(fields[2]) != self.pgid:
+      return None
+    cpu = (int(fields[11]) + int(fields[12])) / self.clock_ticks
+    rss = int(fields[21]) * self.page_size
+    read_bytes = write_bytes = ctx_switches = 0
+    try:
+      with open('/proc/%s/io' % pid) as f:
+        for line in f:
+          if line.startswith('read_bytes:'):
+            read_bytes = int(line.split()[1])
+          elif line.startswith('write_bytes:'):
+            write_bytes = int(line.split()[1])
+    except PermissionError:
+      pass
+    with open('/proc/%s/status' % pid) as f:
+      for line in f:
+        if line.startswith(('voluntary_ctxt_switches:', 'nonvoluntary_ctxt_switches:')):
+          ctx_switches += int(line.split()[1])
+    return rss, (cpu, read_bytes, write_bytes, ctx_switches)
+
+  def Sample(self):
+    total_rss = 0
+    for pid in os.listdir('/proc'):
+      if not pid.isdigit():
+        continue
+      try:
+        usage = self.ReadProcess(pid)
+      except (OSError, ValueError, IndexError):
+        continue
+      if usage:
+        total_rss += usage[0]
+        self.counters[pid] = usage[1]
+    totals = [sum(x[i] for x in self.counters.values()) for i in range(4)]
+
+    swap = 0
+    with open('/proc/meminfo') as f:
+      for line in f:
+        if line.startswith('SwapTotal:'):
+          swap += int(line.split()[1]) * 1024
+        elif line.startswith('SwapFree:'):
+          swap -= int(line.split()[1]) * 1024
+    with open('/proc/loadavg') as f:
+      load = float(f.read().split()[0])
+    self.samples.append([round(time.monotonic() - self.start_time, 2), round(totals[0], 2),
+                         total_rss] + totals[1:] + [load, swap])
+
+  def Stop(self):
+    self.stop_event.set()
+    self.thread.join()
+
+  def GetSummary(self):
+    summary = {'elapsed': round(time.monotonic() - self.start_time, 2),
+               'cpu': 0, 'read_bytes': 0, 'write_bytes': 0, 'ctx_switches': 0,
+               'peak_cpu_percent': 0, 'peak_rss': 0, 'peak_load': 0, 'peak_swap': 0}
+    last_sample = None
+    for sample in self.samples:
+      _, cpu, rss, read_bytes, write_bytes, ctx_switches, load, swap = sample
+      summary.update(cpu=cpu, read_bytes=read_bytes, write_bytes=write_bytes,
+                     ctx_switches=ctx_switches)
+      summary['peak_rss'] = max(summary['peak_rss'], rss)
+      summary['peak_load'] = max(summary['peak_load'], load)
+      summary['peak_swap'] = max(summary['peak_swap'], swap)
+      if last_sample and sample[0] > last_sample[0]:
+        cpu_percent = (cpu - last_sample[1]) * 100 / (sample[0] - last_sample[0])
+        summary['peak_cpu_percent'] = max(summary['peak_cpu_percent'], round(cpu_percent))
+      last_sample = sample
+    return summary
+
+  def Save(self, file_path):
+    with open(file_path, 'w') as f:
+      json.dump({'interval': self.interval, 'summary': self.GetSummary(),
+                 'columns': RESOURCE_COLUMNS, 'samples': self.samples}, f)
+
+
+class LogWriter(object):
+  # Synchronize the log to disk when either the time interval or the size is
+  # reached, also from a timer so that the last lines of a hanging test are not
+  # held back. Setting sync_interval to 0 synchronizes every line. A plain log is
+  # flushed on every line, a log is compressed on the fly if the file name ends
+  # with ".gz" and only flushed on synchronization to keep the compression ratio.
+  def __init__(self, log_path, sync_interval=LOG_SYNC_INTERVAL, sync_bytes=LOG_SYNC_BYTES):
+    self.compressed = log_path.endswith('.gz')
+    if self.compressed:
+      self.log_file = gzip.open(log_path, 'wt', LOG_COMPRESS_LEVEL, encoding='utf-8')
+    else:
+      self.log_file = open(log_path, 'w', encoding='utf-8')
+    self.sync_interval = sync_interval
+    self.sync_bytes = sync_bytes
+    self.pending_bytes = 0
+    self.last_sync = time.monotonic()
+    self.lock = threading.RLock()
+    self.stop_event = threading.Event()
+    self.thread = None
+    if sync_interval:
+      self.thread = threading.Thread(target=self.Run, daemon=True)
+      self.thread.start()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.Close()
+
+  def Run(self):
+    while not self.stop_event.wait(self.sync_interval):
+      with self.lock:
+        if self.pending_bytes and time.monotonic() - self.last_sync >= self.sync_interval:
+          self.Sync()
+
+  def Write(self, line):
+    with self.lock:
+      self.log_file.write(line)
+      self.pending_bytes += len(line)
+      if (self.pending_bytes >= self.sync_bytes or
+          time.monotonic() - self.last_sync >= self.sync_interval):
+        self.Sync()
+      elif not self.compressed:
+        self.log_file.flush()
+
+  def Sync(self):
+    with self.lock:
+      self.log_file.flush()
+      os.fsync(self.log_file.fileno())
+      self.pending_bytes = 0
+      self.last_sync = time.monotonic()
+
+  def Close(self):
+    self.stop_event.set()
+    if self.thread:
+      self.thread.join()
+    with self.lock:
+      if not self.log_file.closed:
+        self.Sync()
+        self.log_file.close()
+
+
+class OutputTee(object):
+  # Write to the stream and keep a copy of the output, see capture_output().
+  def __init__(self, stream):
+    self.stream = stream
+    self.buffer = io.StringIO()
+    self.lock = threading.Lock()
+
+  def write(self, text):
+    with self.lock:
+      self.buffer.write(text)
+    return self.stream.write(text)
+
+  def flush(self):
+    self.stream.flush()
+
+
 def is_win():
   return sys.platform == 'win32'
 
@@ -109,34 +390,144 @@ def execute(command, dir=None, env=None):
   print('\n[%s] \'%s\' in \'%s\'' % 
         (get_currenttime('%Y/%m/%d %H:%M:%S'), ' '.join(command),
          path.abspath(dir) if dir else os.getcwd()))
-  subprocess.run(command, cwd=dir, env=env, shell=is_win(), check=True)
+  if not isinstance(sys.stdout, OutputTee):
+    subprocess.run(command, cwd=dir, env=env, shell=is_win(), check=True)
+    return
+  # The output is captured, pass it through Python.
+  process = subprocess.Popen(command, cwd=dir, env=env, shell=is_win(),
+                             stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+  for line in iter(process.stdout.readline, b''):
+    print(line.decode('utf-8', 'ignore').rstrip(), flush=True)
+  retcode = process.wait()
+  if retcode:
+    raise CalledProcessError(retcode, command)
+
+@contextlib.contextmanager
+def capture_output():
+  # Yield a StringIO that gets a copy of everything printed in the block, including
+  # the output of execute() and execute_progress().
+  tee = OutputTee(sys.stdout)
+  sys.stdout = tee
+  try:
+    yield tee.buffer
+  finally:
+    sys.stdout = tee.stream
 
 def execute_return(command, dir=None, env=None):
   ret = subprocess.run(command, cwd=dir, env=env, shell=is_win(),
                        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
   return ret.stdout.strip()
 
-def execute_log(command, log_path, print_log=True, dir=None, env=None):
+def start_trace():
+  global TRACE_EVENTS, TRACE_START
+  TRACE_EVENTS, TRACE_START = [], time.perf_counter()
+
+@contextlib.contextmanager
+def trace_span(name, category='tryjob', **args):
+  # Record the time of the block as a complete event, the threads are separate tracks.
+  if TRACE_EVENTS is None:
+    yield
+    return
+  start_time = time.perf_counter()
+  try:
+    yield
+  except BaseException as e:
+    args['error'] = str(e) or type(e).__name__
+    raise
+  finally:
+    event = {'name': name, 'cat': category, 'ph': 'X', 'pid': os.getpid(),
+             'tid': threading.get_ident(), 'ts': round((start_time - TRACE_START) * 1e6),
+             'dur': round((time.perf_counter() - start_time) * 1e6)}
+    if args:
+      event['args'] = args
+    with TRACE_LOCK:
+      TRACE_EVENTS.append(event)
+      TRACE_THREADS[event['tid']] = threading.current_thread().name
+
+def save_trace(file_path):
+  # The file can be opened in chrome://tracing or https://ui.perfetto.dev.
+  with TRACE_LOCK:
+    events = [{'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid,
+               'args': {'name': name}} for tid, name in TRACE_THREADS.items()]
+    events += sorted(TRACE_EVENTS or [], key=lambda x: x['ts'])
+  with open(file_path, 'w') as f:
+    json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+def kill_process_tree(process):
+  if is_win():
+    subprocess.run(['taskkill', '/F', '/T', '/PID', str(process.pid)],
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+  else:
+    # The process is the leader of its own process group, see execute_log().
+    try:
+      os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+      pass
+
+def kill_live_processes():
+  # Kill the processes of execute_log() and don't start new ones until reset.
+  with LIVE_PROCESSES_LOCK:
+    LIVE_PROCESSES_KILLED.set()
+    for process in LIVE_PROCESSES:
+      kill_process_tree(process)
+
+def reset_live_processes():
+  LIVE_PROCESSES_KILLED.clear()
+
+def execute_log(command, log_path, print_log=True, dir=None, env=None, output=None,
+                sync_interval=LOG_SYNC_INTERVAL, line_handler=None,
+                timeout=None, inactivity_timeout=None,
+                resource_path=None, sample_interval=RESOURCE_SAMPLE_INTERVAL):
   print('\n[%s] \'%s\' in \'%s\'' % 
         (get_currenttime('%Y/%m/%d %H:%M:%S'), ' '.join(command),
-         path.abspath(dir) if dir else os.getcwd()))
-  process = subprocess.Popen(command, cwd=dir, env=env, shell=is_win(),
-                             stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-  with open(log_path, 'w', encoding='utf-8') as log_file:
-    for line in iter(process.stdout.readline, b''):
-      line = line.decode('utf-8', 'ignore').strip()
-      log_file.write(line + '\n')
-      log_file.flush()
-      os.fsync(log_file.fileno())
-      if print_log:
-        print(line, flush=True)
+         path.abspath(dir) if dir else os.getcwd()), file=output)
+  # Start a new process group so that the whole process tree can be killed.
+  with LIVE_PROCESSES_LOCK:
+    if LIVE_PROCESSES_KILLED.is_set():
+      raise KeyboardInterrupt
+    process = subprocess.Popen(command, cwd=dir, env=env, shell=is_win(),
+                               start_new_session=not is_win(),
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    LIVE_PROCESSES.add(process)
+  line = ''
+  sampler = None
+  if resource_path and sample_interval and is_linux():
+    sampler = ResourceSampler(process, sample_interval)
+  try:
+    with ProcessWatchdog(process, timeout, inactivity_timeout) as watchdog:
+      with LogWriter(log_path, sync_interval) as log_writer:
+        for line in iter(process.stdout.readline, b''):
+          watchdog.Touch()
+          line = line.decode('utf-8', 'ignore').strip()
+          log_writer.Write(line + '\n')
+          if line_handler:
+            line_handler(line)
+          if print_log:
+            print(line, file=output, flush=True)
+
+        retcode = process.wait()
+        watchdog.Stop()
+        if LIVE_PROCESSES_KILLED.is_set():
+          raise KeyboardInterrupt
+        if watchdog.reason:
+          error = ProcessTimeoutError(command, watchdog.limit, watchdog.reason,
+                                      watchdog.GetElapsed(), line)
+          log_writer.Write('[WATCHDOG] %s\n' % error)
+          raise error
+  finally:
+    with LIVE_PROCESSES_LOCK:
+      LIVE_PROCESSES.discard(process)
+    if sampler:
+      sampler.Stop()
+      sampler.Save(resource_path)
 
-  retcode = process.wait()
   if retcode:
     raise CalledProcessError(retcode, command)
 
 
-def execute_progress(command, dir=None, env=None):
+def execute_progress(command, dir=None, env=None, name=None):
+  # With a name, the lines are prefixed with it and the progress bar is printed on
+  # separate lines every PROGRESS_STEP percent, so that parallel builds can interleave.
   is_ninja = command[0].find('ninja') >= 0
   start_time = get_currenttime()
   last_progress = 0
@@ -149,10 +540,12 @@ def execute_progress(command, dir=None, env=None):
                              stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
   for line in iter(process.stdout.readline, b''):
     line = line.decode().strip()
-    if is_ninja:
-      match = re_match(PATTERN_NINJA_PROGRESS, line)
+    match = re_match(PATTERN_NINJA_PROGRESS, line) if is_ninja else None
 
     if not match:
+      if name:
+        print('[%s] %s' % (name, line), flush=True)
+        continue
       if not endline:
         endline = True
         print()
@@ -160,10 +553,13 @@ def execute_progress(command, dir=None, env=None):
       continue
 
     progress = int(match.group(1)) * 100 // int(match.group(2))
-    if progress == last_progress:
+    if progress == last_progress or name and progress < last_progress + PROGRESS_STEP and progress < 100:
       continue
     last_progress = progress
     total_seconds = (get_currenttime() - start_time).total_seconds()
+    if name:
+      print('[%s] %d%%    Total time: %d min' % (name, progress, total_seconds // 60), flush=True)
+      continue
 
     line = '['
     for i in range(progress//2):
@@ -1,21 +1,55 @@
+import codecs
+import collections
 import email.utils
 import glob
+import gzip
 import json
 import os
+import queue
+import re
 import shutil
 import smtplib
 import stat
 import sys
+import threading
 import zipfile
+import zlib
 
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
 from email import encoders
 from email.mime.base import MIMEBase
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from os import path
 
+try:
+  import fcntl
+except ImportError:
+  fcntl = None
+
 REPOSITORY_DIR = path.dirname(path.dirname(path.abspath(__file__)))
 
+COMPRESSED_EXT = '.gz'
+COMPRESS_LEVEL = 6
+DECOMPRESS_CHUNK_SIZE = 1 << 20
+DECOMPRESS_QUEUE_SIZE = 8
+
+TRYJOB_CONFIG = None
+
+JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
+JSON_DELIMITER  = re.compile(r'[ \t\n\r,\]}]')
+JSON_SIMPLE_KEY = re.compile(r'"([^"\\]*)"[ \t\n\r]*:')
+JSON_CHUNK_SIZE = 1 << 16
+
+ZIP_COMPRESS_LEVEL = 6
+# The larger files are streamed into the zip by ZipFile.write instead of being
+# compressed in memory by the threads of zip_files().
+ZIP_PARALLEL_SIZE = 8 << 20
+
+# The ioctl on Linux to share the extents of a file on Btrfs/XFS, FICLONE in linux/fs.h.
+IOCTL_FICLONE = 0x40049409
+
 def mkdir(dir_path):
   try:
     os.makedirs(dir_path)
@@ -35,6 +69,26 @@ def copy(src, dest):
     print(src + ' not exists')
     assert False
 
+def clone_file(src, dest, hardlink=False):
+  # Return how the file is cloned: "hardlink", "reflink" or "copy". A reflink is
+  # copy-on-write, while a hardlink changes along with the source.
+  if hardlink:
+    try:
+      os.link(src, dest)
+      return 'hardlink'
+    except OSError:
+      pass
+  if fcntl:
+    try:
+      with open(src, 'rb') as src_file, open(dest, 'wb') as dest_file:
+        fcntl.ioctl(dest_file.fileno(), IOCTL_FICLONE, src_file.fileno())
+      shutil.copymode(src, dest)
+      return 'reflink'
+    except OSError:
+      pass
+  shutil.copy(src, dest)
+  return 'copy'
+
 def remove(pathname):
   def onerror(func, path, exc):
     if not os.access(path, os.W_OK):
@@ -55,12 +109,82 @@ def remove(pathname):
   else:
     assert False
 
-def zip(dest_file, src_dir):
+def zip(dest_file, src_dir, store_ext=[], threads=None):
+  files = {}
+  for root, _, file_names in os.walk(src_dir):
+    for file_name in file_names:
+      src_file = path.join(root, file_name)
+      files[path.relpath(src_file, src_dir)] = src_file
+  return zip_files(dest_file, files, store_ext, threads)
+
+def zip_files(dest_file, files, store_ext=[], threads=None):
+  # Zip the files from the names in the zip to their source files, and return the
+  # ZipInfo of them. The files up to ZIP_PARALLEL_SIZE are deflated in memory in
+  # parallel, zlib releases the GIL, and written by this thread, which also streams
+  # the larger files meanwhile. A file is stored without compression if its
+  # extension is in store_ext or deflating doesn't make it smaller.
+  def compress(name):
+    src_file = files[name]
+    zip_info = zipfile.ZipInfo.from_file(src_file, name)
+    with open(src_file, 'rb') as f:
+      data = f.read()
+    zip_info.file_size = len(data)
+    zip_info.CRC = zlib.crc32(data)
+    zip_info.compress_type = zipfile.ZIP_STORED
+    if not path.splitext(name)[1].lower() in store_ext:
+      compressor = zlib.compressobj(ZIP_COMPRESS_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+      compressed_data = compressor.compress(data) + compressor.flush()
+      if len(compressed_data) < len(data):
+        zip_info.compress_type = zipfile.ZIP_DEFLATED
+        data = compressed_data
+    zip_info.compress_size = len(data)
+    return zip_info, data
+
+  def write(zip_file, zip_info, data):
+    # zipfile has no API to write the data compressed elsewhere, so the entry is
+    # written the same way as ZipFile.write does with the attributes of ZipFile,
+    # which are the same from Python 3.6 to 3.13. The central directory is written
+    # from filelist on close.
+    zip_info.header_offset = zip_file.fp.tell()
+    zip_file.fp.write(zip_info.FileHeader())
+    zip_file.fp.write(data)
+    zip_file.filelist.append(zip_info)
+    zip_file.NameToInfo[zip_info.filename] = zip_info
+    zip_file.start_dir = zip_file.fp.tell()
+    zip_file._didModify = True
+
+  threads = threads or os.cpu_count()
   with zipfile.ZipFile(dest_file, 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as zip_file:
-    for root, _, files in os.walk(src_dir):
-      for src_file in files:
-        src_file = path.join(root, src_file)
-        zip_file.write(src_file, path.relpath(src_file, src_dir))
+    # Fall back to ZipFile.write for all files if a later Python drops the attributes.
+    parallel = all(hasattr(zip_file, x) for x in ['fp', 'filelist', 'NameToInfo',
+                                                 'start_dir', '_didModify'])
+    # Limit the compressed files waiting to be written, they are in memory.
+    pending = collections.deque()
+    with ThreadPoolExecutor(threads) as executor:
+      for name in files:
+        if parallel and path.getsize(files[name]) <= ZIP_PARALLEL_SIZE:
+          pending.append(executor.submit(compress, name))
+          if len(pending) > threads * 2:
+            write(zip_file, *pending.popleft().result())
+        else:
+          compress_type = (zipfile.ZIP_STORED if path.splitext(name)[1].lower() in store_ext
+                           else zipfile.ZIP_DEFLATED)
+          zip_file.write(files[name], name, compress_type)
+      while pending:
+        write(zip_file, *pending.popleft().result())
+    return zip_file.infolist()
+
+def compress_file(file_path):
+  with open(file_path, 'rb') as src_file:
+    with gzip.open(file_path + COMPRESSED_EXT, 'wb', COMPRESS_LEVEL) as dest_file:
+      shutil.copyfileobj(src_file, dest_file)
+  os.remove(file_path)
+
+def open_file(file_path, mode='r'):
+  # The file is decompressed transparently if it ends with ".gz".
+  if file_path.endswith(COMPRESSED_EXT):
+    return gzip.open(file_path, mode + 't')
+  return open(file_path, mode)
 
 def unzip(src_file, dest_dir):
   with zipfile.ZipFile(src_file, 'r') as zip_file:
@@ -68,13 +192,123 @@ def unzip(src_file, dest_dir):
 
 def read_json(file_path):
   try:
-    with open(file_path, 'r') as json_file:
+    with open_file(file_path, 'r') as json_file:
       return json.load(json_file)
   except ValueError:
     return {}
 
+def read_json_event(file_path, decode_depth=None):
+  # Yield ('start_map', None), ('map_key', key), ('end_map', None) and ('value', value)
+  # while reading the file chunk by chunk. Only objects are streamed, any other value
+  # (including arrays) is decoded as a whole. The objects at decode_depth or deeper
+  # (the top-level object is at depth 1) are decoded as a whole by one call of the
+  # decoder if they end within the next chunk, otherwise they are streamed as well.
+  decoder = json.JSONDecoder()
+  with open_file(file_path, 'r') as json_file:
+    buf, pos, eof = '', 0, False
+
+    def fill():
+      nonlocal buf, pos, eof
+      chunk = json_file.read(JSON_CHUNK_SIZE)
+      eof = not chunk
+      buf, pos = buf[pos:] + chunk, 0
+
+    def peek():
+      nonlocal pos
+      while True:
+        pos = JSON_WHITESPACE.match(buf, pos).end()
+        if pos < len(buf):
+          return buf[pos]
+        if eof:
+          raise ValueError('Unexpected end of JSON file: ' + file_path)
+        fill()
+
+    def decode():
+      nonlocal pos
+      # Numbers and literals have no terminator, make sure they are read completely.
+      if buf[pos] not in '"[':
+        while not eof and not JSON_DELIMITER.search(buf, pos):
+          fill()
+      while True:
+        try:
+          value, pos = decoder.raw_decode(buf, pos)
+          return value
+        except ValueError:
+          if eof:
+            raise
+        fill()
+
+    def decode_map():
+      nonlocal pos
+      try:
+        value, pos = decoder.raw_decode(buf, pos)
+        return value
+      except ValueError:
+        if eof or len(buf) - pos >= JSON_CHUNK_SIZE:
+          return None
+      fill()
+      try:
+        value, pos = decoder.raw_decode(buf, pos)
+        return value
+      except ValueError:
+        return None
+
+    depth, state = 0, 'value'
+    while True:
+      if state == 'next' and not depth:
+        return
+      char = peek()
+      if state == 'value':
+        value = None
+        if char == '{' and decode_depth and depth + 1 >= decode_depth:
+          value = decode_map()
+        if value is not None:
+          state = 'next'
+          yield 'value', value
+        elif char == '{':
+          pos += 1
+          depth += 1
+          state = 'first_key'
+          yield 'start_map', None
+        else:
+          state = 'next'
+          yield 'value', decode()
+      elif state in ['first_key', 'key']:
+        if char == '}' and state == 'first_key':
+          pos += 1
+          depth -= 1
+          state = 'next'
+          yield 'end_map', None
+        elif char == '"':
+          match = JSON_SIMPLE_KEY.match(buf, pos)
+          if match:
+            key, pos = match.group(1), match.end()
+          else:
+            key = decode()
+            if peek() != ':':
+              raise ValueError('Expecting \':\' in JSON file: ' + file_path)
+            pos += 1
+          state = 'value'
+          yield 'map_key', key
+        else:
+          raise ValueError('Expecting property name in JSON file: ' + file_path)
+      elif char == ',':
+        pos += 1
+        state = 'key'
+      elif char == '}':
+        pos += 1
+        depth -= 1
+        yield 'end_map', None
+      else:
+        raise ValueError('Expecting \',\' or \'}\' in JSON file: ' + file_path)
+
 def load_tryjob_config():
-  return read_json(path.join(REPOSITORY_DIR, 'tryjob.json'))
+  # The configuration is read once per process, return a copy so the callers
+  # can't affect each other.
+  global TRYJOB_CONFIG
+  if TRYJOB_CONFIG is None:
+    TRYJOB_CONFIG = read_json(path.join(REPOSITORY_DIR, 'tryjob.json'))
+  return deepcopy(TRYJOB_CONFIG)
 
 def list_file(dir_path):
   for item in os.listdir(dir_path):
@@ -90,8 +324,71 @@ def write_file(file_path, content):
   with open(file_path, 'w') as f:
     f.write(content)
 
+def write_file_atomic(file_path, content):
+  # Write to a temporary file and rename it over the file, so that the readers and
+  # an interrupted write never see a partial file. The temporary file is unique to
+  # the process and the thread, the last writer wins. The content is str or bytes.
+  temp_file = '%s.%d.%d.tmp' % (file_path, os.getpid(), threading.get_ident())
+  try:
+    with open(temp_file, 'wb' if isinstance(content, bytes) else 'w') as f:
+      f.write(content)
+    os.replace(temp_file, file_path)
+  finally:
+    if path.exists(temp_file):
+      os.remove(temp_file)
+
+def read_compressed_line(file_path):
+  # Decompress in another thread, zlib releases the GIL so that it runs in
+  # parallel with the caller. The lines are split like universal newlines mode.
+  chunks = queue.Queue(DECOMPRESS_QUEUE_SIZE)
+  stopped = threading.Event()
+
+  def decompress():
+    try:
+      with gzip.open(file_path, 'rb') as f:
+        while not stopped.is_set():
+          chunk = f.read(DECOMPRESS_CHUNK_SIZE)
+          chunks.put(chunk)
+          if not chunk:
+            break
+    except Exception as e:
+      chunks.put(e)
+
+  thread = threading.Thread(target=decompress, daemon=True)
+  thread.start()
+  try:
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    rest = ''
+    while True:
+      chunk = chunks.get()
+      if isinstance(chunk, Exception):
+        raise chunk
+      text = rest + decoder.decode(chunk, final=not chunk)
+      # Keep the trailing '\r' in case the next chunk starts with '\n'.
+      carry = '\r' if chunk and text.endswith('\r') else ''
+      if carry:
+        text = text[:-1]
+      lines = text.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+      rest = lines.pop() + carry
+      for line in lines:
+        yield line.rstrip()
+      if not chunk:
+        break
+    if rest:
+      yield rest.rstrip()
+  finally:
+    stopped.set()
+    while thread.is_alive():
+      try:
+        chunks.get(timeout=0.1)
+      except queue.Empty:
+        pass
+
 def read_line(file_path):
-  with open(file_path, 'r') as f:
+  if file_path.endswith(COMPRESSED_EXT):
+    yield from read_compressed_line(file_path)
+    return
+  with open_file(file_path, 'r') as f:
     line = f.readline()
     while line:
       yield line.rstrip()